@@ -0,0 +1,68 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+# Throughput of concurrent objstr() calls with different numbers of threads.
+# On a free-threaded build, the throughput should scale close to linearly
+# with the number of threads, up to the number of cores.
+#
+# Usage: python benchmarks/bench_threads.py [max_threads] [calls_per_thread]
+
+import os
+import sys
+import threading
+import time
+
+from objprint import objstr
+
+
+class Node:
+    def __init__(self, idx, children):
+        self.idx = idx
+        self.name = f"node_{idx}"
+        self.values = [idx * 0.5, idx * 1.5, idx * 2.5]
+        self.children = children
+
+
+def build_tree(depth, width):
+    if depth == 0:
+        return []
+    return [Node(i, build_tree(depth - 1, width)) for i in range(width)]
+
+
+def run(n_threads, calls, obj):
+    barrier = threading.Barrier(n_threads + 1)
+
+    def worker():
+        barrier.wait()
+        for _ in range(calls):
+            objstr(obj)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return n_threads * calls / (time.perf_counter() - start)
+
+
+def main():
+    max_threads = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    obj = build_tree(3, 6)
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"Python {sys.version.split()[0]}, GIL {'enabled' if gil else 'disabled'}")
+
+    base = None
+    n_threads = 1
+    while n_threads <= max_threads:
+        throughput = run(n_threads, calls, obj)
+        if base is None:
+            base = throughput
+        print(f"{n_threads:>3} threads: {throughput:10.1f} calls/s, speedup {throughput / base:5.2f}x")
+        n_threads *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -4,13 +4,17 @@
 __version__ = "0.3.0"
 
 
-from .objprint import ObjPrint
+from .color_util import Theme
+from .objprint import ObjPrint, RenderContext
 from .decorator import add_objprint
+from .lazy import ObjPrintFormatter, lazy, view
 
 _objprint = ObjPrint()
 op = objprint = _objprint
 objstr = _objprint.objstr
 objjson = _objprint.objjson
+snapshot = _objprint.snapshot
+render_snapshot = _objprint.render_snapshot
 config = _objprint.config
 install = _objprint.install
 
@@ -19,7 +23,14 @@ __all__ = [
     "op",
     "objstr",
     "objjson",
+    "snapshot",
+    "render_snapshot",
     "config",
     "add_objprint",
-    "install"
+    "install",
+    "lazy",
+    "view",
+    "ObjPrintFormatter",
+    "RenderContext",
+    "Theme",
 ]
@@ -1,7 +1,11 @@
 # Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
+import os
+import re
 import sys
+from typing import Any, Dict, Tuple, Union
+import weakref
 
 
 class COLOR:
@@ -30,7 +34,182 @@ if sys.platform == "win32":
         color_support = False
 
 
+# The prefix and suffix of each color, built once
+COLOR_WRAPPERS: Dict[str, Tuple[str, str]] = {
+    color: (color, COLOR.DEFAULT) if color_support else ("", "")
+    for name, color in vars(COLOR).items() if not name.startswith("_")
+}
+
+# Whether each stream shows colors, see stream_color_support()
+_stream_color: "weakref.WeakKeyDictionary[Any, bool]" = weakref.WeakKeyDictionary()
+
+
 def set_color(s: str, color: str) -> str:
-    if color_support:
-        return f"{color}{s}{COLOR.DEFAULT}"
-    return f"{s}"  # pragma: no cover
+    prefix, suffix = get_color_wrapper(color)
+    return f"{prefix}{s}{suffix}"
+
+
+def get_color_wrapper(color: str) -> Tuple[str, str]:
+    """
+    return the prefix and suffix that set_color() puts around a string
+    """
+    wrapper = COLOR_WRAPPERS.get(color)
+    if wrapper is None:
+        return (color, COLOR.DEFAULT) if color_support else ("", "")
+    return wrapper
+
+
+def stream_color_support(file: Any) -> bool:
+    """
+    check if the output to file should be colored. It should be a TTY, and
+    NO_COLOR should not be set. The result is kept for each stream
+    """
+    try:
+        return _stream_color[file]
+    except (KeyError, TypeError):
+        pass
+
+    supported = color_support and not os.environ.get("NO_COLOR")
+    if supported:
+        try:
+            supported = file.isatty()
+        except (AttributeError, ValueError):
+            # No isatty() or the file is closed
+            supported = False
+
+    try:
+        _stream_color[file] = supported
+    except TypeError:
+        # Can't be weakly referenced, check it every time
+        pass
+    return supported
+
+
+# A style is None for no color, a color name of COLOR like "green", an int
+# of the 256-color palette or a truecolor hex like "#ff8700"
+Style = Union[None, str, int]
+
+_NO_COLOR = ("", "")
+
+# The escape sequences that take no width on the terminal
+_ESCAPE_RE = re.compile(r"\033\[[0-?]*[ -/]*[@-~]")
+
+
+def get_style_wrapper(style: Style) -> Tuple[str, str]:
+    """
+    compile style to the prefix and suffix around the colored string
+    """
+    if style is None or not color_support:
+        return _NO_COLOR
+    if isinstance(style, bool):
+        raise TypeError(f"Wrong type for style - {style}")
+    if isinstance(style, int):
+        if not 0 <= style <= 255:
+            raise ValueError(f"256-color style should be in [0, 255], not {style}")
+        return f"\033[38;5;{style}m", COLOR.DEFAULT
+    if isinstance(style, str):
+        if style.startswith("\033"):
+            # An escape sequence like COLOR.GREEN
+            return style, COLOR.DEFAULT
+        if style.startswith("#"):
+            try:
+                if len(style) != 7:
+                    raise ValueError
+                r, g, b = (int(style[idx:idx + 2], 16) for idx in (1, 3, 5))
+            except ValueError:
+                raise ValueError(f"Truecolor style should be like #rrggbb, not {style}") from None
+            return f"\033[38;2;{r};{g};{b}m", COLOR.DEFAULT
+        color = getattr(COLOR, style.upper(), None) if not style.startswith("_") else None
+        if color is None:
+            raise ValueError(f"Unknown color {style}")
+        return COLOR_WRAPPERS[color]
+    raise TypeError(f"Wrong type for style - {style}")
+
+
+class Theme:
+    """
+    The styles of the roles in the colored output. The roles not given keep
+    the default style, pass None to turn a role off. All the escape sequences
+    are built when the theme is created, rendering only looks them up
+    """
+    # The characters around the header of an object
+    header_start = "<"
+    header_end = ">"
+
+    # Whether the multiline containers and objects are collapsible, see collapse()
+    collapsible = False
+
+    DEFAULT_STYLES: Dict[str, Style] = {
+        "attr": "green",
+        "header": "cyan",
+        "label": "yellow",
+        "method": "magenta",
+        "string": None,
+        "number": None,
+        "arg_name": "red",
+        "line_number": "green",
+    }
+
+    def __init__(self, **styles: Style) -> None:
+        for role in styles:
+            if role not in self.DEFAULT_STYLES:
+                raise ValueError(f"{role} is not a role, should be one of {tuple(self.DEFAULT_STYLES)}")
+        self.styles = {**self.DEFAULT_STYLES, **styles}
+        wrappers = {role: self.get_wrapper(style) for role, style in self.styles.items()}
+
+        # (prefix, suffix) of each role
+        self.attr = wrappers["attr"]
+        self.header = wrappers["header"]
+        self.label = wrappers["label"]
+        self.method = wrappers["method"]
+        self.string = wrappers["string"]
+        self.number = wrappers["number"]
+        self.arg_name = wrappers["arg_name"]
+        self.line_number = wrappers["line_number"]
+
+        # The colored strings that never change
+        self.footer = self.wrap(self.header_end, "header")
+        self.def_keyword = self.wrap("def", "method")
+        self.del_keyword = self.wrap("del", "method")
+
+        # The colored prefixes of the attribute lines by name
+        self._attr_prefixes: Dict[str, str] = {}
+
+    def get_wrapper(self, style: Style) -> Tuple[str, str]:
+        return get_style_wrapper(style)
+
+    def escape(self, s: str) -> str:
+        return s
+
+    def get_width(self, s: str) -> int:
+        """
+        the displayed width of the rendered s, without the escape sequences
+        """
+        if "\033" not in s:
+            return len(s)
+        return len(_ESCAPE_RE.sub("", s))
+
+    def collapse(self, header: str, footer: str, expanded: bool) -> Tuple[str, str]:
+        return header, footer
+
+    def wrap(self, s: str, role: str) -> str:
+        prefix, suffix = getattr(self, role)
+        return f"{prefix}{s}{suffix}"
+
+    def attr_prefix(self, key: str) -> str:
+        prefix = self._attr_prefixes.get(key)
+        if prefix is None:
+            prefix = self._attr_prefixes[key] = f"{self.wrap('.' + self.escape(key), 'attr')} = "
+        return prefix
+
+    def get_header(self, type_name: str, obj_id: str) -> str:
+        prefix, suffix = self.header
+        return f"{prefix}{self.header_start}{self.escape(type_name)} {obj_id}{suffix}"
+
+    def __repr__(self) -> str:
+        styles = ", ".join(f"{role}={style!r}" for role, style in self.styles.items()
+                           if style != self.DEFAULT_STYLES[role])
+        return f"{type(self).__name__}({styles})"
+
+
+DEFAULT_THEME = Theme()
@@ -2,13 +2,85 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
+import copy
 import functools
-from typing import Callable, Optional, Type, TypeVar, Set, Union, overload
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Type, TypeVar, Set, Union, overload
+)
+import weakref
+
+from .objprint import _PrintConfig
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .objprint import ObjPrint
 
 
 T = TypeVar("T", bound=Type)
 
 
+class _ClassRenderer:
+    """
+    render the instances of a decorated class with a config that's validated
+    once. With attr_source "dir", the names of the class that match the
+    patterns are found once too, and only the instance __dict__ is checked
+    on each call. The names are found again when the class changes
+    """
+    def __init__(self, cls: type, printer: "ObjPrint", kwargs: Dict[str, Any]) -> None:
+        self.printer = printer
+        self.global_config = _PrintConfig._global
+        self.cfg = printer._configs.overwrite(**kwargs)
+        self.matched: Dict[str, bool] = {}
+        self.use_objprint = hasattr(cls, "__objprint__")
+        self.use_record = printer._use_record_fields(cls, self.cfg)
+        self.use_class_names = self.cfg.attr_source == "dir" and cls.__dir__ is object.__dir__
+        # The version of the class when the names are found, no class is kept
+        # so the renderer never keeps the class alive
+        self.mro_ids: Tuple[int, ...] = ()
+        self.class_keys: List[FrozenSet[str]] = []
+        self.class_names: List[str] = []
+        self.class_name_set: FrozenSet[str] = frozenset()
+
+    def _match(self, name: str) -> bool:
+        matched = self.matched.get(name)
+        if matched is None:
+            matched = self.matched[name] = self.printer._match_attr(name, self.cfg)
+        return matched
+
+    def _update_class_names(self, cls: type) -> None:
+        """
+        find the names of cls again if an attribute is added to or deleted
+        from any class in the MRO, or the MRO changes
+        """
+        mro = cls.__mro__
+        if tuple(map(id, mro)) == self.mro_ids and \
+                all(base.__dict__.keys() == keys for base, keys in zip(mro, self.class_keys)):
+            return
+        self.mro_ids = tuple(map(id, mro))
+        self.class_keys = [frozenset(base.__dict__) for base in mro]
+        names = dir(cls)
+        self.class_names = [name for name in names if self._match(name)]
+        self.class_name_set = frozenset(names)
+
+    def render(self, obj: Any) -> str:
+        # The per call states are kept in a copy
+        cfg = copy.copy(self.cfg)
+        memo: Optional[Set] = set() if cfg.skip_recursion else None
+        if self.use_objprint or self.use_record or not self.use_class_names:
+            # __objprint__, the generated renderer of a record class, or the generic discovery
+            return str(self.printer._get_custom_object_str(obj, memo, indent_level=0, cfg=cfg))
+
+        self._update_class_names(type(obj))
+        names = self.class_names
+        instance_dict = getattr(obj, "__dict__", None)
+        if instance_dict:
+            class_name_set = self.class_name_set
+            names = names + [
+                name for name in instance_dict
+                if name not in class_name_set and self._match(name)
+            ]
+        return str(self.printer._get_custom_object_str(obj, memo, indent_level=0, cfg=cfg, attr_names=names))
+
+
 @overload
 def add_objprint(
         orig_class: None = None,
@@ -35,16 +107,24 @@ def add_objprint(
         def __str__(self) -> str:
             return json.dumps(_objprint.objjson(self), **kwargs)
     else:
+        # The renderer of each class is built when the class is decorated, or
+        # on the first call for a subclass, and rebuilt when the global config
+        # changes. The classes are weakly referenced so they can be collected
+        renderers: "weakref.WeakKeyDictionary[type, _ClassRenderer]" = weakref.WeakKeyDictionary()
+
         def __str__(self) -> str:
-            cfg = _objprint._configs.overwrite(**kwargs)
-            memo: Optional[Set] = set() if cfg.skip_recursion else None
-            return _objprint._get_custom_object_str(self, memo, indent_level=0, cfg=cfg)
+            renderer = renderers.get(type(self))
+            if renderer is None or renderer.global_config is not _PrintConfig._global:
+                renderer = renderers[type(self)] = _ClassRenderer(type(self), _objprint, kwargs)
+            return renderer.render(self)
+
+    def decorate(cls: T) -> T:
+        cls.__str__ = functools.wraps(cls.__str__)(__str__)  # type: ignore
+        if format != "json":
+            renderers[cls] = _ClassRenderer(cls, _objprint, kwargs)
+        return cls
 
     if orig_class is None:
-        def wrapper(cls: T) -> T:
-            cls.__str__ = functools.wraps(cls.__str__)(__str__)  # type: ignore
-            return cls
-        return wrapper
+        return decorate
     else:
-        orig_class.__str__ = functools.wraps(orig_class.__str__)(__str__)  # type: ignore
-        return orig_class
+        return decorate(orig_class)
@@ -0,0 +1,226 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+from collections import OrderedDict
+import copy
+import threading
+from types import FunctionType
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .objprint import ObjPrint, _PrintConfig
+
+
+# Values of these types are rendered the same as long as they are the same object
+_ATOMIC_TYPES = {str, int, float, bool, type(None)}
+
+
+class _DiffState:
+    def __init__(
+            self,
+            ref: Callable[[], Any],
+            leaves: Dict[str, str],
+            nodes: Dict[str, Tuple[tuple, List[Tuple[str, str]]]],
+            cfg_vars: Dict[str, Any],
+            type_formatter: dict):
+        self.ref = ref
+        # path -> rendered value of every leaf in the last rendering
+        self.leaves = leaves
+        # path -> (children, leaves) of the nodes whose children are all atomic
+        self.nodes = nodes
+        self.cfg_vars = cfg_vars
+        self.type_formatter = type_formatter
+
+
+class ObjDiffer:
+    """
+    Keep the last rendering of objects, keyed by identity, and render only
+    the attribute paths that changed since then
+    """
+    # The number of objects whose last rendering is kept, the least recently
+    # printed ones are forgotten first
+    max_states = 128
+
+    def __init__(self, printer: "ObjPrint"):
+        self.printer = printer
+        self.states: "OrderedDict[int, _DiffState]" = OrderedDict()
+        # Guard the states against the prints in other threads
+        self._lock = threading.Lock()
+        # The states of the objects that died while the lock was held
+        self._dead: List[int] = []
+
+    def clear(self) -> None:
+        with self._lock:
+            self.states = OrderedDict()
+
+    def _remove_state(self, key: int) -> None:
+        # The object can die in the middle of an update of the states, in the
+        # same thread, so never wait for the lock here
+        if not self._lock.acquire(blocking=False):
+            self._dead.append(key)
+            return
+        try:
+            self._remove_dead_state(key)
+        finally:
+            self._lock.release()
+
+    def _remove_dead_state(self, key: int) -> None:
+        state = self.states.get(key)
+        if state is not None and state.ref() is None:
+            del self.states[key]
+
+    def diff_str(self, obj: Any, memo: Optional[Set[int]], cfg: "_PrintConfig") -> str:
+        with self._lock:
+            while self._dead:
+                self._remove_dead_state(self._dead.pop())
+            state = self.states.get(id(obj))
+        if state is not None and state.ref() is not obj:
+            # The object died and the id is reused
+            state = None
+
+        cfg_vars = {key: val for key, val in vars(cfg).items() if not key.startswith("_")}
+        type_formatter = self.printer.type_formatter
+        prev_nodes = {}
+        if state is not None and state.cfg_vars == cfg_vars and state.type_formatter is type_formatter:
+            prev_nodes = state.nodes
+
+        leaves: Dict[str, str] = {}
+        nodes: Dict[str, Tuple[tuple, List[Tuple[str, str]]]] = {}
+        self._flatten(obj, "", memo, 0, cfg, leaves, nodes, prev_nodes, {})
+
+        ref: Callable[[], Any]
+        if state is not None:
+            ref = state.ref
+        else:
+            try:
+                ref = weakref.ref(obj)
+                # Forget the object when it dies
+                weakref.finalize(obj, self._remove_state, id(obj)).atexit = False
+            except TypeError:
+                # Keep the object alive so its id won't be reused, the number
+                # of states is capped so it won't be kept forever
+                ref = (lambda o: lambda: o)(obj)
+        new_state = _DiffState(ref, leaves, nodes, cfg_vars, type_formatter)
+        with self._lock:
+            self.states[id(obj)] = new_state
+            self.states.move_to_end(id(obj))
+            while len(self.states) > self.max_states:
+                self.states.popitem(last=False)
+
+        if "" in leaves:
+            # It can't be split into paths
+            return leaves[""]
+
+        # The first print shows every path, so the object is only rendered once
+        prev_leaves = state.leaves if state is not None else {}
+        elems = [
+            self._get_change_line(path, val, cfg)
+            for path, val in leaves.items() if prev_leaves.get(path) != val
+        ]
+        for path in prev_leaves:
+            if path not in leaves:
+                elems.append(f"{cfg.theme.del_keyword} {path}" if cfg.color else f"del {path}")
+
+        return str(self.printer._get_pack_str(elems, obj, 0, cfg))
+
+    def _get_change_line(self, path: str, val: str, cfg: "_PrintConfig") -> str:
+        if cfg.color:
+            return f"{cfg.theme.wrap(path, 'attr')} = {val}"
+        return f"{path} = {val}"
+
+    def _get_children(
+            self,
+            obj: Any,
+            memo: Optional[Set[int]],
+            level: int,
+            cfg: "_PrintConfig") -> Optional[List[Tuple[str, Any]]]:
+        """
+        return the (path suffix, value) of the children of obj, or None if obj
+        should be rendered as a whole
+        """
+        printer = self.printer
+        if (printer.type_formatter and printer._find_formatter(type(obj)) is not None) or \
+                isinstance(obj, (str, int, float, FunctionType, set)) or obj is None:
+            return None
+
+        if (memo is not None and id(obj) in memo) or level >= cfg.depth:
+            return None
+
+        if isinstance(obj, (list, tuple)):
+            children = [(f"[{idx}]", val) for idx, val in enumerate(obj)]
+        elif isinstance(obj, dict):
+            children = [
+                (f"[{str(printer._objstr(key, None, level + 1, cfg))}]", val)
+                for key, val in printer._get_dict_items(obj)
+            ]
+        elif hasattr(type(obj), "__objprint__"):
+            fields = printer._get_objprint_fields(obj)
+            if isinstance(fields, str) or fields is None:
+                return None
+            children = [(f".{key}", val) for key, val in fields if printer._match_attr(key, cfg)]
+        elif printer._should_honor_existing(obj, cfg):
+            return None
+        else:
+            _, attrs = printer._get_attrs(obj, cfg)
+            children = [(f".{key}", val) for key, val in attrs]
+
+        return children or None
+
+    def _flatten(
+            self,
+            obj: Any,
+            path: str,
+            memo: Optional[Set[int]],
+            level: int,
+            cfg: "_PrintConfig",
+            leaves: Dict[str, str],
+            nodes: Dict[str, Tuple[tuple, List[Tuple[str, str]]]],
+            prev_nodes: Dict[str, Tuple[tuple, List[Tuple[str, str]]]],
+            level_cfgs: Dict[int, "_PrintConfig"]) -> None:
+        children = self._get_children(obj, memo, level, cfg)
+        if children is None:
+            leaves[path] = self._render_leaf(obj, memo, level, cfg, level_cfgs)
+            return
+
+        if memo is not None:
+            memo = memo.copy()
+            memo.add(id(obj))
+
+        if all(type(val) in _ATOMIC_TYPES for _, val in children):
+            prev = prev_nodes.get(path)
+            if prev is not None and len(prev[0]) == len(children) and all(
+                    key == prev_key and val is prev_val for (key, val), (prev_key, prev_val) in zip(children, prev[0])):
+                # The children are the same objects, reuse the last rendering
+                node_leaves = prev[1]
+            else:
+                node_leaves = [
+                    (path + key, self._render_leaf(val, memo, level + 1, cfg, level_cfgs))
+                    for key, val in children
+                ]
+            # The children are kept so they can be compared by identity
+            nodes[path] = (tuple(children), node_leaves)
+            leaves.update(node_leaves)
+            return
+
+        for key, val in children:
+            self._flatten(val, path + key, memo, level + 1, cfg, leaves, nodes, prev_nodes, level_cfgs)
+
+    def _render_leaf(
+            self,
+            obj: Any,
+            memo: Optional[Set[int]],
+            level: int,
+            cfg: "_PrintConfig",
+            level_cfgs: Dict[int, "_PrintConfig"]) -> str:
+        if level <= 1:
+            return str(self.printer._objstr(obj, memo, level, cfg))
+        # The leaf is displayed at indent level 1, shift the depth so the
+        # depth limit still counts from the root
+        if level not in level_cfgs:
+            level_cfg = copy.copy(cfg)
+            level_cfg.depth = cfg.depth - level + 1
+            level_cfg._render_cache = None
+            level_cfgs[level] = level_cfg
+        return str(self.printer._objstr(obj, memo, 1, level_cfgs[level]))
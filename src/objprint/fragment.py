@@ -0,0 +1,53 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+from typing import Any, List, Optional, Union
+
+
+class Fragment:
+    """
+    A piece of multiline rendered output made of strings and other fragments.
+
+    The strings are only joined when the fragment is emitted, so putting a
+    fragment into a bigger one does not copy its content. Single line
+    output is short and stays a plain str
+    """
+    __slots__ = ("parts",)
+
+    def __init__(self, parts: Optional[List[Union[str, "Fragment"]]] = None) -> None:
+        self.parts: List[Union[str, Fragment]] = parts if parts is not None else []
+
+    def write(self, s: Union[str, "Fragment"]) -> None:
+        self.parts.append(s)
+
+    def flatten(self) -> List[str]:
+        ret: List[str] = []
+        stack = [iter(self.parts)]
+        while stack:
+            for part in stack[-1]:
+                if part.__class__ is Fragment:
+                    stack.append(iter(part.parts))  # type: ignore
+                    break
+                ret.append(part)  # type: ignore
+            else:
+                stack.pop()
+        return ret
+
+    def write_to(self, file: Any) -> None:
+        file.writelines(self.flatten())
+
+    def __str__(self) -> str:
+        return "".join(self.flatten())
+
+
+Rendered = Union[str, Fragment]
+
+
+def concat(*parts: Rendered) -> Rendered:
+    """
+    concatenate the parts, only join them if none of them is a fragment
+    """
+    for part in parts:
+        if isinstance(part, Fragment):
+            return Fragment(list(parts))
+    return "".join(parts)  # type: ignore
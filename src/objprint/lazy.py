@@ -0,0 +1,100 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+
+import logging
+from typing import Any, Dict, Iterable, Optional
+
+
+class LazyObjStr:
+    """
+    A wrapper that only renders obj with objstr when it's converted to str,
+    so passing it to a disabled logger costs nothing but the wrapper
+    """
+    __slots__ = ("obj", "kwargs")
+
+    def __init__(self, obj: Any, **kwargs) -> None:
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        from . import _objprint
+        return _objprint.objstr(self.obj, **self.kwargs)
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+    def __format__(self, format_spec: str) -> str:
+        return format(self.__str__(), format_spec)
+
+
+def lazy(obj: Any, **kwargs) -> LazyObjStr:
+    return LazyObjStr(obj, **kwargs)
+
+
+class ObjView:
+    """
+    A view of obj for Jupyter and IPython. It's only rendered when it's
+    displayed, as collapsible html with the top level expanded. The number
+    of elements, the depth and the total number of nodes are bounded unless
+    they are given, so a huge object is displayed right away. The plain text
+    is only a fallback, so it's bounded further
+    """
+    __slots__ = ("obj", "kwargs")
+
+    defaults: Dict[str, Any] = {"elements": 100, "depth": 8, "max_nodes": 1000, "expand": 1, "color": True}
+    plain_defaults: Dict[str, Any] = {"elements": 10, "depth": 3, "max_nodes": 50, "color": False}
+
+    def __init__(self, obj: Any, **kwargs) -> None:
+        self.obj = obj
+        self.kwargs = kwargs
+
+    def _repr_html_(self) -> str:
+        from . import _objprint
+        return _objprint.objstr(self.obj, **{**self.defaults, **self.kwargs}, backend="html")
+
+    def _repr_mimebundle_(self, include: Optional[Iterable[str]] = None, exclude: Optional[Iterable[str]] = None):
+        renderers = {
+            "text/html": self._repr_html_,
+            "text/plain": self.__repr__,
+        }
+        return {
+            mimetype: render() for mimetype, render in renderers.items()
+            if (include is None or mimetype in include) and (exclude is None or mimetype not in exclude)
+        }
+
+    def __repr__(self) -> str:
+        from . import _objprint
+        return _objprint.objstr(self.obj, **{**self.defaults, **self.plain_defaults, **self.kwargs, "color": False})
+
+
+def view(obj: Any, **kwargs) -> ObjView:
+    return ObjView(obj, **kwargs)
+
+
+class ObjPrintFormatter(logging.Formatter):
+    """
+    A logging formatter that renders the arguments of the records with
+    objstr. Strings and numbers are kept as they are, so %d still works.
+    The arguments are only rendered when a handler formats the record
+    """
+    def __init__(self, *args, objprint_config: Optional[Dict[str, Any]] = None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.objprint_config = objprint_config if objprint_config is not None else {}
+
+    def format(self, record: logging.LogRecord) -> str:
+        args = record.args
+        if args:
+            if isinstance(args, dict):
+                record.args = {key: self._wrap(val) for key, val in args.items()}
+            else:
+                record.args = tuple(self._wrap(arg) for arg in args)
+        try:
+            return super().format(record)
+        finally:
+            record.args = args
+
+    def _wrap(self, arg: Any) -> Any:
+        if isinstance(arg, (str, int, float, LazyObjStr)) or arg is None:
+            return arg
+        return LazyObjStr(arg, **self.objprint_config)
@@ -0,0 +1,122 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+import html
+import re
+import string
+from typing import Optional, Tuple
+import weakref
+
+from .color_util import COLOR, Style, Theme
+
+
+# The colors of the first 16 colors of the 256-color palette in xterm
+_BASIC_COLORS = (
+    "#000000", "#cd0000", "#00cd00", "#cdcd00", "#0000ee", "#cd00cd", "#00cdcd", "#e5e5e5",
+    "#7f7f7f", "#ff0000", "#00ff00", "#ffff00", "#5c5cff", "#ff00ff", "#00ffff", "#ffffff",
+)
+
+# The palette index of each escape sequence of COLOR
+_COLOR_INDEX = {
+    color: idx for idx, color in enumerate(
+        (COLOR.BLACK, COLOR.RED, COLOR.GREEN, COLOR.YELLOW, COLOR.BLUE, COLOR.MAGENTA, COLOR.CYAN, COLOR.WHITE)
+    )
+}
+
+# The text is escaped, so every "<" starts a tag
+_TAG_RE = re.compile(r"<[^>]*>")
+
+# The html theme of each theme, built on the first html render
+_html_themes: "weakref.WeakKeyDictionary[Theme, HtmlTheme]" = weakref.WeakKeyDictionary()
+
+
+def get_style_css(style: Style) -> Optional[str]:
+    """
+    convert a style of Theme to a css color, None if it has no color
+    """
+    if style is None:
+        return None
+    if isinstance(style, bool):
+        raise TypeError(f"Wrong type for style - {style}")
+    if isinstance(style, int):
+        if not 0 <= style <= 255:
+            raise ValueError(f"256-color style should be in [0, 255], not {style}")
+        if style < 16:
+            return _BASIC_COLORS[style]
+        if style >= 232:
+            level = 8 + (style - 232) * 10
+            return f"#{level:02x}{level:02x}{level:02x}"
+        r, g, b = ((style - 16) // 36, (style - 16) // 6 % 6, (style - 16) % 6)
+        return "#" + "".join(f"{0 if v == 0 else 55 + v * 40:02x}" for v in (r, g, b))
+    if isinstance(style, str):
+        if style.startswith("#"):
+            if len(style) != 7 or any(c not in string.hexdigits for c in style[1:]):
+                raise ValueError(f"Truecolor style should be like #rrggbb, not {style}")
+            return style
+        if style.startswith("\033"):
+            if style not in _COLOR_INDEX:
+                return None
+            return _BASIC_COLORS[_COLOR_INDEX[style]]
+        color = getattr(COLOR, style.upper(), None) if not style.startswith("_") else None
+        if color is None:
+            raise ValueError(f"Unknown color {style}")
+        return _BASIC_COLORS[_COLOR_INDEX[color]] if color in _COLOR_INDEX else None
+    raise TypeError(f"Wrong type for style - {style}")
+
+
+class HtmlTheme(Theme):
+    """
+    The theme of the html backend. The text is escaped, the roles are in
+    <span>s of their colors, and every multiline container or object is a
+    <details> that can be collapsed to its header
+    """
+    header_start = "&lt;"
+    header_end = "&gt;"
+    collapsible = True
+
+    # The whole output keeps the layout of the text output, a collapsed
+    # <details> is shown as "header ... footer" like the objects too deep
+    document = (
+        '<div class="objprint"><style>'
+        ".objprint {white-space: pre; font-family: monospace} "
+        ".objprint details, .objprint summary {display: inline; cursor: pointer} "
+        '.objprint details:not([open]) > summary::after {content: " ... "}'
+        "</style>",
+        "</div>",
+    )
+    details_expanded = "<details open><summary>"
+    details_collapsed = "<details><summary>"
+
+    def get_wrapper(self, style: Style) -> Tuple[str, str]:
+        css = get_style_css(style)
+        if css is None:
+            return ("", "")
+        return f'<span style="color: {css}">', "</span>"
+
+    def escape(self, s: str) -> str:
+        return html.escape(s, quote=False)
+
+    def get_width(self, s: str) -> int:
+        if "<" not in s and "&" not in s:
+            return len(s)
+        return len(html.unescape(_TAG_RE.sub("", s)))
+
+    def collapse(self, header: str, footer: str, expanded: bool) -> Tuple[str, str]:
+        details_start = self.details_expanded if expanded else self.details_collapsed
+        # The footer stays out of <details> so a collapsed one still closes
+        return f"{details_start}{header}</summary>", f"</details>{footer}"
+
+
+# The html theme when color is off
+PLAIN_HTML_THEME = HtmlTheme(**{role: None for role in Theme.DEFAULT_STYLES})
+
+
+def get_html_theme(theme: Theme, color: bool) -> HtmlTheme:
+    if not color:
+        return PLAIN_HTML_THEME
+    if isinstance(theme, HtmlTheme):
+        return theme
+    html_theme = _html_themes.get(theme)
+    if html_theme is None:
+        html_theme = _html_themes[theme] = HtmlTheme(**theme.styles)
+    return html_theme
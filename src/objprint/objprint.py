@@ -2,20 +2,73 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
-from collections import namedtuple
+import abc
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import copy
+import enum
+import functools
 import inspect
 import itertools
 import json
+import math
+import multiprocessing
+import os
+import random
 import re
-from types import FunctionType, FrameType
-from typing import Any, Callable, Iterable, List, Optional, Set, TypeVar, Type
-
-from .color_util import COLOR, set_color
+import sys
+import threading
+import weakref
+from types import (
+    BuiltinFunctionType, ClassMethodDescriptorType, FunctionType, FrameType, MemberDescriptorType,
+    MethodDescriptorType, WrapperDescriptorType
+)
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Type, Union
+
+from .color_util import DEFAULT_THEME, Theme, stream_color_support
+from .diff import ObjDiffer
+from .fragment import Fragment, Rendered, concat
 from .frame_analyzer import FrameAnalyzer
+from .markup import HtmlTheme, get_html_theme
+from .record import RecordInfo, RecordRenderer, compile_record_renderer, get_record_info
+from .snapshot import SnapshotReader, SnapshotWriter
+from .stream import STREAMED, ChunkedWriter, PackStream, PrefixHook, StreamHook, open_file, stream_always
+from .summary import summarize
 
 
 SourceLine = TypeVar("SourceLine", str, List[str])
 
+# The descriptors on a class that give regular fields or methods
+_NOT_COMPUTED_DESCRIPTORS = (
+    MemberDescriptorType, FunctionType, BuiltinFunctionType, staticmethod, classmethod,
+    MethodDescriptorType, WrapperDescriptorType, ClassMethodDescriptorType
+)
+
+# Map the bytes that are not printable ascii to "."
+_PRINTABLE_ASCII = bytes(b if 0x20 <= b < 0x7f else ord(".") for b in range(256))
+
+_ParallelState = Tuple["ObjPrint", List[Any], Optional[Set[int]], "_PrintConfig", bool]
+
+# The state of the current parallel rendering, forked worker processes
+# inherit it so the objects never need to be pickled
+_parallel_state: Optional[_ParallelState] = None
+_parallel_lock = threading.Lock()
+
+
+def _render_chunk(state: Optional[_ParallelState], start: int, stop: int) -> List[str]:
+    if state is None:
+        # We are in a forked worker
+        state = _parallel_state
+    assert state is not None
+    printer, values, memo, cfg, is_dict = state
+    # Each chunk has its own per call states, like the render cache, so the
+    # threads never share them
+    cfg = copy.copy(cfg)
+    cfg._render_cache = None
+    if is_dict:
+        return [str(printer._get_dict_item_str(key, val, memo, 1, cfg)) for key, val in values[start:stop]]
+    return [str(printer._objstr(val, memo, 1, cfg)) for val in values[start:stop]]
+
 
 class _PrintConfig:
     enable: bool = True
@@ -23,8 +76,15 @@ class _PrintConfig:
     depth: int = 100
     width: int = 80
     color: bool = True
+    theme: Theme = DEFAULT_THEME
+    backend: str = "text"
+    expand: int = -1
     label: List[str] = []
     elements: int = -1
+    max_nodes: int = -1
+    sample: int = -1
+    summary: bool = False
+    seed: int = 0
     attr_pattern: str = r"(?!_).*"
     exclude: List[str] = []
     include: List[str] = []
@@ -33,34 +93,181 @@ class _PrintConfig:
     print_methods: bool = False
     skip_recursion: bool = True
     honor_existing: bool = True
+    buffer_window: int = 32
+    workers: int = 1
+    render_cache: int = 0
+    diff: bool = False
+    print_properties: bool = True
+    attr_source: str = "dir"
+    chunk_size: int = 65536
+    fsync: str = "never"
+    compress: str = "auto"
+
+    _choices = {
+        "attr_source": ("dir", "instance", "instance+class"),
+        "fsync": ("never", "chunk", "close"),
+        "compress": ("auto", "none", "gzip", "lzma", "bz2"),
+        "backend": ("text", "html"),
+    }
+
+    # The smallest valid value of the int options, -1 means no limit
+    _minimums = {
+        "max_nodes": -1,
+        "sample": -1,
+        "expand": -1,
+        "buffer_window": 0,
+        "workers": 1,
+        "render_cache": 0,
+        "chunk_size": 1,
+    }
+
+    # The global configs are published as a whole new dict on every set(),
+    # so a config created concurrently always sees a consistent snapshot
+    _global: Dict[str, Any] = {}
+    _lock = threading.Lock()
+
+    # Whether color is set explicitly, globally or for the call. op() only
+    # checks whether the output is a terminal if it's not
+    _color_set: bool = False
+
+    # The render cache of a single call, see ObjPrint._objstr_cached()
+    _render_cache: Optional["OrderedDict[Tuple[int, int], Tuple[Any, Rendered, Set[int]]]"] = None
+
+    # The ids checked against the memo while a value to cache is rendered,
+    # see ObjPrint._objstr_cached()
+    _visited: Optional[Set[int]] = None
+
+    # The number of nodes left to render in a single call, see ObjPrint._take_node().
+    # It's a list so the copies of the config share it
+    _nodes_left: Optional[List[int]] = None
+
+    # The sink of a streamed print, see ObjPrint._print_streamed(). The hook
+    # is only set when the current position is allowed to write to the sink
+    _sink: Optional[ChunkedWriter] = None
+    _stream_hook: Optional[StreamHook] = None
 
     def __init__(self, **kwargs):
+        self.__dict__.update(self._global)
         for key, val in kwargs.items():
-            if hasattr(self, key):
-                if isinstance(val, type(getattr(self, key))):
-                    setattr(self, key, val)
-                else:
-                    raise TypeError(f"Wrong type for {key} - {val}")
-            else:
-                raise ValueError(f"{key} is not configurable")
+            self._check(key, val)
+            setattr(self, key, val)
+        if "color" in kwargs:
+            self._color_set = True
+        if self.backend == "html":
+            # The html theme escapes the text, so the colored path is always
+            # taken. color only decides whether the roles have colors
+            self.theme = get_html_theme(self.theme, self.color)
+            self.color = True
 
     def set(self, **kwargs) -> None:
         for key, val in kwargs.items():
-            if hasattr(_PrintConfig, key):
-                if isinstance(val, type(getattr(_PrintConfig, key))):
-                    setattr(_PrintConfig, key, val)
-                else:
-                    raise TypeError(f"Wrong type for {key} - {val}")
-            else:
-                raise ValueError(f"{key} is not configurable")
+            self._check(key, val)
+        with _PrintConfig._lock:
+            new_global = dict(_PrintConfig._global)
+            new_global.update(kwargs)
+            if "color" in kwargs:
+                new_global["_color_set"] = True
+            for key, val in kwargs.items():
+                setattr(_PrintConfig, key, val)
+            _PrintConfig._global = new_global
 
     def overwrite(self, **kwargs) -> "_PrintConfig":
         ret = _PrintConfig(**kwargs)
         return ret
 
+    def _check(self, key: str, val: Any) -> None:
+        if key.startswith("_") or not hasattr(_PrintConfig, key):
+            raise ValueError(f"{key} is not configurable")
+        if not isinstance(val, type(getattr(_PrintConfig, key))):
+            raise TypeError(f"Wrong type for {key} - {val}")
+        if key in self._choices and val not in self._choices[key]:
+            raise ValueError(f"{key} should be one of {self._choices[key]}, not {val}")
+        if key in self._minimums and val < self._minimums[key]:
+            raise ValueError(f"{key} should be at least {self._minimums[key]}, not {val}")
+
+
+_PrintConfig._global = {
+    key: val for key, val in vars(_PrintConfig).items()
+    if not key.startswith("_") and not callable(val)
+}
+
+
+class RenderContext:
+    """
+    The context of a formatter registered with context=True, so it can
+    render the children in the same traversal as the object
+    """
+    __slots__ = ("printer", "obj", "memo", "indent_level", "cfg")
+
+    def __init__(
+            self,
+            printer: "ObjPrint",
+            obj: Any,
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: _PrintConfig) -> None:
+        self.printer = printer
+        self.obj = obj
+        self.memo = memo
+        self.indent_level = indent_level
+        self.cfg = cfg
+
+    @property
+    def indent(self) -> str:
+        return self.printer.add_indent("", self.indent_level, self.cfg)
+
+    @property
+    def depth(self) -> int:
+        """
+        the number of levels that can still be expanded
+        """
+        return self.cfg.depth - self.indent_level
+
+    @property
+    def width(self) -> int:
+        return self.cfg.width
+
+    @property
+    def nodes_left(self) -> int:
+        """
+        the number of nodes that can still be rendered in the call, -1 if
+        there's no max_nodes
+        """
+        cfg = self.cfg
+        if cfg.max_nodes == -1:
+            return -1
+        if cfg._nodes_left is None:
+            cfg._nodes_left = [cfg.max_nodes]
+        return cfg._nodes_left[0]
+
+    def render(self, child: Any) -> str:
+        """
+        render child as an element of the object, one level deeper. Every
+        child takes a node from max_nodes, so the formatter can't render more
+        than the budget
+        """
+        memo = self.memo
+        if memo is not None and id(self.obj) not in memo:
+            memo = self.memo = memo | {id(self.obj)}
+        nodes_left = self.nodes_left
+        if nodes_left == 0:
+            return self.printer._get_ellipsis(child, self.cfg)
+        rendered = str(self.printer._objstr(child, memo, self.indent_level + 1, self.cfg))
+        if nodes_left != -1 and self.nodes_left == nodes_left:
+            # The child is not unpacked so it didn't take a node itself
+            self.printer._take_node(self.cfg)
+        return rendered
+
+    def pack(self, elems: Iterable[str]) -> str:
+        """
+        pack the rendered elements with the header of the object, the same
+        way as the containers are printed
+        """
+        return str(self.printer._get_pack_str(elems, self.obj, self.indent_level, self.cfg))
+
 
 class ObjPrint:
-    FormatterInfo = namedtuple('FormatterInfo', ['formatter', 'inherit'])
+    FormatterInfo = namedtuple('FormatterInfo', ['formatter', 'inherit', 'context'], defaults=(False,))
 
     def __init__(self):
         self._configs = _PrintConfig()
@@ -73,7 +280,21 @@ class ObjPrint:
         }
         self._sys_print = print
         self.frame_analyzer = FrameAnalyzer()
-        self.type_formatter = {}
+        self.differ = ObjDiffer(self)
+        # type_formatter is never modified in place, register/unregister
+        # publish a new dict so concurrent renders can read it without a lock
+        self.type_formatter: Dict[Type[Any], ObjPrint.FormatterInfo] = {}
+        # The abc cache token and the formatter of each concrete type, None if
+        # there's no formatter. It's replaced by an empty cache after
+        # type_formatter is changed, or a virtual subclass of an ABC is registered
+        self._resolved_formatters: Tuple[object, "weakref.WeakKeyDictionary[type, Optional[ObjPrint.FormatterInfo]]"] = \
+            (abc.get_cache_token(), weakref.WeakKeyDictionary())
+        self._formatter_lock = threading.Lock()
+        # The record info of each class, and the generated renderers of the
+        # record classes for the configs that change the lines
+        self._records: "weakref.WeakKeyDictionary[type, Optional[RecordInfo]]" = weakref.WeakKeyDictionary()
+        self._record_renderers: "weakref.WeakKeyDictionary[type, Dict[Tuple[Any, ...], Optional[RecordRenderer]]]" = \
+            weakref.WeakKeyDictionary()
 
     def __call__(self, *objs: Any, file: Any = None, format: str = "string", **kwargs) -> Any:
         cfg = self._configs.overwrite(**kwargs)
@@ -86,7 +307,14 @@ class ObjPrint:
 
             # Strip the kwargs that only works in op() so it won't break
             # json.dumps()
-            kwargs.pop("arg_name", None)
+            for key in ("arg_name", "chunk_size", "fsync", "compress"):
+                kwargs.pop(key, None)
+
+            if cfg.backend == "text" and cfg.color and not cfg._color_set:
+                # Unless color is configured explicitly, only use it when the
+                # output is a terminal
+                cfg.color = not isinstance(file, (str, os.PathLike)) and \
+                    stream_color_support(sys.stdout if file is None else file)
 
             if cfg.line_number:
                 self._sys_print(self._get_line_number_str(call_frame, cfg=cfg))
@@ -96,28 +324,31 @@ class ObjPrint:
                 if args is None:
                     args = ["Unknown Arg" for _ in range(len(objs))]
                 if cfg.color:
-                    args = [set_color(f"{arg}:", COLOR.RED) for arg in args]
+                    args = [cfg.theme.wrap(f"{arg}:", "arg_name") for arg in args]
                 else:
                     args = [f"{arg}:" for arg in args]
 
-            if format == "json":
-                if cfg.arg_name:
-                    for arg, obj in zip(args, objs):
-                        self._sys_print(arg)
-                        self._sys_print(json.dumps(self.objjson(obj), **kwargs))
-                else:
-                    for obj in objs:
-                        self._sys_print(json.dumps(self.objjson(obj), **kwargs))
-            else:
-                # Force color with cfg as if color is not in cfg, objstr will default to False
-                kwargs["color"] = cfg.color
-                if cfg.arg_name:
-                    for arg, obj in zip(args, objs):
-                        self._sys_print(arg)
-                        self._sys_print(self.objstr(obj, **kwargs), file=file)
+            out, should_close = open_file(file, cfg.compress)
+            try:
+                if format == "json":
+                    if cfg.arg_name:
+                        for arg, obj in zip(args, objs):
+                            self._sys_print(arg)
+                            self._sys_print(json.dumps(self.objjson(obj), **kwargs), file=out)
+                    else:
+                        for obj in objs:
+                            self._sys_print(json.dumps(self.objjson(obj), **kwargs), file=out)
                 else:
-                    for obj in objs:
-                        self._sys_print(self.objstr(obj, **kwargs), file=file)
+                    if cfg.arg_name:
+                        for arg, obj in zip(args, objs):
+                            self._sys_print(arg)
+                            self._print_streamed(obj, cfg, out)
+                    else:
+                        for obj in objs:
+                            self._print_streamed(obj, cfg, out)
+            finally:
+                if should_close:
+                    out.close()
             if self.frame_analyzer.return_object(call_frame):
                 return objs[0] if len(objs) == 1 else objs
             else:
@@ -130,63 +361,547 @@ class ObjPrint:
         if "color" not in kwargs:
             kwargs["color"] = False
         cfg = self._configs.overwrite(**kwargs)
+        return self._get_document_str(self._render(obj, cfg), cfg)
+
+    def _get_document_str(self, rendered: Rendered, cfg: _PrintConfig) -> str:
+        if isinstance(cfg.theme, HtmlTheme):
+            document_start, document_end = cfg.theme.document
+            return f"{document_start}{rendered}{document_end}"
+        return str(rendered)
+
+    def _render(self, obj: Any, cfg: _PrintConfig) -> Rendered:
+        """
+        render obj from the top level, the result is only joined by the caller
+        """
         memo: Optional[Set[int]] = set() if cfg.skip_recursion else None
+        if cfg.diff:
+            return self.differ.diff_str(obj, memo, cfg)
+        if cfg.workers > 1 and cfg.sample == -1 and cfg.max_nodes == -1 and not cfg.summary and cfg.depth > 0 and \
+                isinstance(obj, (list, tuple, set, dict)) and self._find_formatter(type(obj)) is None and \
+                self._get_record_info(type(obj)) is None:
+            # NamedTuples are printed by their fields, not as containers
+            return self._objstr_parallel(obj, memo, cfg)
         return self._objstr(obj, memo, indent_level=0, cfg=cfg)
 
-    def _objstr(self, obj: Any, memo: Optional[Set[int]], indent_level: int, cfg: _PrintConfig) -> str:
+    def _print_streamed(self, obj: Any, cfg: _PrintConfig, file: Any) -> None:
+        """
+        print obj to file while it's being rendered. The output is written
+        in chunks of cfg.chunk_size as soon as a multiline pack starts, so
+        it's never held in memory as a whole
+        """
+        sink = ChunkedWriter(file if file is not None else sys.stdout, cfg.chunk_size, cfg.fsync)
+        document_start, document_end = cfg.theme.document if isinstance(cfg.theme, HtmlTheme) else ("", "")
+        sink.write(document_start)
+        cfg._sink = sink
+        if not cfg.diff:
+            cfg._stream_hook = stream_always
+        try:
+            rendered = self._render(obj, cfg)
+        finally:
+            cfg._sink = None
+            cfg._stream_hook = None
+        sink.write_rendered(rendered)
+        sink.write(document_end)
+        sink.write("\n")
+        sink.close()
+
+    def _objstr_parallel(self, obj: Any, memo: Optional[Set[int]], cfg: _PrintConfig) -> Rendered:
+        """
+        render the elements of a top level container in a pool of cfg.workers,
+        then pack them the same way as the serial path does
+        """
+        values: List[Any] = self._get_dict_items(obj) if isinstance(obj, dict) else list(obj)
+        if cfg.elements != -1:
+            # The serial path renders one extra element to know if there are more
+            values = values[:cfg.elements + 1]
+
+        if len(values) <= 1:
+            return self._objstr(obj, memo, indent_level=0, cfg=cfg)
+
+        child_memo = None
+        if memo is not None:
+            child_memo = memo.copy()
+            child_memo.add(id(obj))
+
+        chunk_size = max(1, -(-len(values) // (cfg.workers * 4)))
+        starts = range(0, len(values), chunk_size)
+        stops = [start + chunk_size for start in starts]
+        state: _ParallelState = (self, values, child_memo, cfg, isinstance(obj, dict))
+
+        # The workers render their chunks in memory, only the pack streams
+        stream_hook = cfg._stream_hook
+        cfg._stream_hook = None
+        try:
+            chunks = self._render_chunks(state, starts, stops)
+        finally:
+            cfg._stream_hook = stream_hook
+
+        if chunks is None:
+            return self._objstr(obj, memo, indent_level=0, cfg=cfg)
+
+        return self._get_pack_str(itertools.chain.from_iterable(chunks), obj, 0, cfg)
+
+    def _render_chunks(self, state: _ParallelState, starts: Iterable[int], stops: List[int]) -> Optional[List[List[str]]]:
+        """
+        render the chunks of the elements in a pool, return None if it can't
+        be done in parallel on this platform
+        """
+        global _parallel_state
+
+        cfg = state[3]
+        if not getattr(sys, "_is_gil_enabled", lambda: True)():
+            with ThreadPoolExecutor(max_workers=cfg.workers) as executor:
+                chunks = list(executor.map(functools.partial(_render_chunk, state), starts, stops))
+        elif self._can_fork():
+            # Forked workers share a snapshot of the address space, so the
+            # objects are not pickled and the ids in headers stay the same
+            with _parallel_lock:
+                _parallel_state = state
+                try:
+                    with ProcessPoolExecutor(
+                        max_workers=cfg.workers,
+                        mp_context=multiprocessing.get_context("fork")
+                    ) as executor:
+                        chunks = list(executor.map(functools.partial(_render_chunk, None), starts, stops))
+                finally:
+                    _parallel_state = None
+        else:
+            return None
+        return chunks
+
+    def _can_fork(self) -> bool:
+        """
+        fork is only safe on Linux when this is the only thread, a forked
+        child gets a copy of the locks other threads might be holding.
+        macOS system libraries are not safe to use after fork either
+        """
+        return sys.platform.startswith("linux") and threading.active_count() == 1 and \
+            "fork" in multiprocessing.get_all_start_methods()
+
+    def _format_with_context(
+            self,
+            formatter: Callable[[Any, RenderContext], str],
+            obj: Any,
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: _PrintConfig) -> str:
+        if cfg._visited is not None:
+            cfg._visited.add(id(obj))
+        if (memo is not None and id(obj) in memo) or indent_level >= cfg.depth:
+            return self._get_ellipsis(obj, cfg)
+
+        if cfg.max_nodes != -1 and not self._take_node(cfg):
+            return self._get_ellipsis(obj, cfg)
+
+        # The formatter returns a whole string, so the children never stream
+        stream_hook = cfg._stream_hook
+        cfg._stream_hook = None
+        try:
+            return formatter(obj, RenderContext(self, obj, memo, indent_level, cfg))
+        finally:
+            cfg._stream_hook = stream_hook
+
+    def _find_formatter(self, obj_type: Type[Any]) -> Optional["ObjPrint.FormatterInfo"]:
+        # Read the cache before type_formatter, they are published in the
+        # reverse order so the cache is never newer than type_formatter
+        token, resolved = self._resolved_formatters
+        current_token = abc.get_cache_token()
+        if token != current_token:
+            # A type may be a virtual subclass of an ABC with a formatter now
+            resolved = weakref.WeakKeyDictionary()
+            self._resolved_formatters = (current_token, resolved)
+        else:
+            try:
+                return resolved[obj_type]
+            except KeyError:
+                pass
+        formatter = resolved[obj_type] = self._resolve_formatter(obj_type, self.type_formatter)
+        return formatter
+
+    def _resolve_formatter(
+            self,
+            obj_type: Type[Any],
+            type_formatter: Dict[Type[Any], "ObjPrint.FormatterInfo"]) -> Optional["ObjPrint.FormatterInfo"]:
+        """
+        find the formatter of obj_type through its MRO. If there's none, try
+        the inheritable formatters of the types that are not in the MRO, so
+        the virtual subclasses of ABCs like collections.abc.Mapping match
+        """
+        for cls in obj_type.__mro__:
+            if cls in type_formatter and (
+                cls == obj_type or type_formatter[cls].inherit
+            ):
+                return type_formatter[cls]
+        for cls, fmt_info in type_formatter.items():
+            if fmt_info.inherit and isinstance(cls, abc.ABCMeta) and issubclass(obj_type, cls):
+                return fmt_info
+        return None
+
+    def _objstr(self, obj: Any, memo: Optional[Set[int]], indent_level: int, cfg: _PrintConfig) -> Rendered:
         # If a custom formatter is registered for the object's type, use it directly
         if self.type_formatter:
-            obj_type = type(obj)
-            for cls in obj_type.__mro__:
-                if cls in self.type_formatter and (
-                    cls == obj_type or self.type_formatter[cls].inherit
-                ):
-                    return self.type_formatter[cls].formatter(obj)
+            fmt_info = self._find_formatter(type(obj))
+            if fmt_info is not None:
+                if fmt_info.context:
+                    return self._format_with_context(fmt_info.formatter, obj, memo, indent_level, cfg)
+                if cfg.color:
+                    return cfg.theme.escape(fmt_info.formatter(obj))
+                return fmt_info.formatter(obj)
+
+        if cfg.summary:
+            summary = summarize(obj)
+            if summary is not None:
+                return cfg.theme.escape(summary) if cfg.color else summary
 
         # If it's builtin type, return it directly
         if isinstance(obj, str):
+            if cfg.color:
+                prefix, suffix = cfg.theme.string
+                return f"{prefix}'{cfg.theme.escape(obj)}'{suffix}"
             return f"'{obj}'"
-        elif isinstance(obj, (int, float)) or obj is None:
+        elif isinstance(obj, (int, float)):
+            if cfg.color:
+                prefix, suffix = cfg.theme.number
+                return f"{prefix}{obj!s}{suffix}"
             return str(obj)
+        elif obj is None:
+            return "None"
         elif isinstance(obj, FunctionType):
+            if cfg.color:
+                return cfg.theme.escape(f"<function {obj.__name__}>")
             return f"<function {obj.__name__}>"
+        elif cfg.honor_existing and isinstance(obj, (bytes, bytearray, memoryview)):
+            if cfg.color:
+                return cfg.theme.escape(self._get_buffer_str(obj, cfg))
+            return self._get_buffer_str(obj, cfg)
 
         # Otherwise we may need to unpack it. Figure out if we should do that first
+        if cfg._visited is not None:
+            cfg._visited.add(id(obj))
         if (memo is not None and id(obj) in memo) or \
                 (cfg.depth is not None and indent_level >= cfg.depth):
             return self._get_ellipsis(obj, cfg)
 
+        if cfg.max_nodes != -1 and not self._take_node(cfg):
+            return self._get_ellipsis(obj, cfg)
+
+        if cfg.render_cache > 0:
+            return self._objstr_cached(obj, memo, indent_level, cfg)
+
+        return self._objstr_unpack(obj, memo, indent_level, cfg)
+
+    def _take_node(self, cfg: _PrintConfig) -> bool:
+        """
+        take a node from the budget of cfg.max_nodes of the call. Every
+        container and object that's unpacked is a node, False if the budget
+        is used up
+        """
+        nodes_left = cfg._nodes_left
+        if nodes_left is None:
+            nodes_left = cfg._nodes_left = [cfg.max_nodes]
+        if nodes_left[0] == 0:
+            return False
+        nodes_left[0] -= 1
+        return True
+
+    def _objstr_cached(self, obj: Any, memo: Optional[Set[int]], indent_level: int, cfg: _PrintConfig) -> Rendered:
+        """
+        render obj with a per call LRU cache for immutable values, so a value
+        that shows up many times is only rendered once for each indent level
+
+        A rendering is only cached and reused when none of the objects in it
+        is in the memo, so it never has a recursion marker of its ancestors
+        """
+        cache = cfg._render_cache
+        if cache is None:
+            cache = cfg._render_cache = OrderedDict()
+
+        outer_visited = cfg._visited
+        key = (id(obj), indent_level)
+        entry = cache.get(key)
+        if entry is not None and (memo is None or entry[2].isdisjoint(memo)):
+            cache.move_to_end(key)
+            if outer_visited is not None:
+                outer_visited |= entry[2]
+            return entry[1]
+
+        if not self._is_immutable(obj):
+            return self._objstr_unpack(obj, memo, indent_level, cfg)
+
+        # A cached value is rendered in memory so it can be reused
+        stream_hook = cfg._stream_hook
+        cfg._stream_hook = None
+        visited: Set[int] = set()
+        cfg._visited = visited if memo is not None else None
+        try:
+            rendered = self._objstr_unpack(obj, memo, indent_level, cfg)
+        finally:
+            cfg._stream_hook = stream_hook
+            cfg._visited = outer_visited
+
+        if outer_visited is not None:
+            outer_visited |= visited
+        if memo is not None and not visited.isdisjoint(memo):
+            return rendered
+
+        # Keep obj in the entry so its id can't be reused during the call
+        cache[key] = (obj, rendered, visited)
+        if len(cache) > cfg.render_cache:
+            cache.popitem(last=False)
+        return rendered
+
+    def _is_immutable(self, obj: Any) -> bool:
+        if isinstance(obj, enum.Enum):
+            return True
+        if not isinstance(obj, (tuple, frozenset)):
+            params = getattr(type(obj), "__dataclass_params__", None)
+            if params is None or not params.frozen:
+                return False
+        try:
+            # Everything in it should be hashable too
+            hash(obj)
+        except TypeError:
+            return False
+        return True
+
+    def _objstr_unpack(self, obj: Any, memo: Optional[Set[int]], indent_level: int, cfg: _PrintConfig) -> Rendered:
         if memo is not None:
             memo = memo.copy()
             memo.add(id(obj))
 
-        if isinstance(obj, (list, tuple, set)):
-            elems = (f"{self._objstr(val, memo, indent_level + 1, cfg)}" for val in obj)
+        if isinstance(obj, tuple) and type(obj) is not tuple and self._get_record_info(type(obj)) is not None:
+            # NamedTuples are printed by their fields
+            return self._get_custom_object_str(obj, memo, indent_level, cfg)
+
+        elems: Iterable[Rendered]
+        if isinstance(obj, (list, tuple, set, dict)) and cfg.sample != -1 and len(obj) > cfg.sample:
+            sampled = self._sample(obj, cfg)
+            if isinstance(obj, dict):
+                sampled = self._get_dict_items(dict(sampled))
+                elems = (self._get_dict_item_str(key, val, memo, indent_level + 1, cfg) for key, val in sampled)
+            else:
+                elems = (self._objstr(val, memo, indent_level + 1, cfg) for val in sampled)
+            elems = itertools.chain(elems, (f"... ({len(obj)} in total)",))
+        elif isinstance(obj, (list, tuple, set)):
+            elems = (self._objstr(val, memo, indent_level + 1, cfg) for val in obj)
         elif isinstance(obj, dict):
-            items = [(key, val) for key, val in obj.items()]
-            try:
-                items = sorted(items)
-            except TypeError:
-                pass
             elems = (
-                f"{self._objstr(key, None, indent_level + 1, cfg)}: {self._objstr(val, memo, indent_level + 1, cfg)}"
-                for key, val in items
+                self._get_dict_item_str(key, val, memo, indent_level + 1, cfg)
+                for key, val in self._get_dict_items(obj)
             )
         else:
             # It's an object
 
-            # If it has __str__ or __repr__ overloaded, honor that
-            if cfg.honor_existing and \
-                    (obj.__class__.__str__ is not object.__str__ or obj.__class__.__repr__ is not object.__repr__):
-                # Make sure we indent properly
-                s = str(obj)
-                lines = s.split("\n")
-                lines[1:] = [self.add_indent(line, indent_level, cfg) for line in lines[1:]]
-                return "\n".join(lines)
+            # If it has __str__ or __repr__ overloaded, honor that, unless
+            # it supports __objprint__
+            if not hasattr(type(obj), "__objprint__") and self._should_honor_existing(obj, cfg):
+                return self._get_existing_str(obj, indent_level, cfg)
             return self._get_custom_object_str(obj, memo, indent_level, cfg)
 
         return self._get_pack_str(elems, obj, indent_level, cfg)
 
+    def _get_existing_str(self, obj: Any, indent_level: int, cfg: _PrintConfig) -> Rendered:
+        """
+        render obj with its own __str__, with the following lines indented.
+
+        A multiline result is kept as a fragment of its lines, so the
+        enclosing levels never copy or indent it again
+        """
+        return self._get_lines_str(str(obj), indent_level, cfg)
+
+    def _get_lines_str(self, s: str, indent_level: int, cfg: _PrintConfig) -> Rendered:
+        if cfg.color:
+            s = cfg.theme.escape(s)
+        if "\n" not in s:
+            return s
+        lines = s.split("\n")
+        newline = "\n" + self.add_indent("", indent_level, cfg)
+        parts: List[Rendered] = [newline] * (2 * len(lines) - 1)
+        parts[::2] = lines
+        return Fragment(parts)
+
+    def _get_buffer_str(self, obj: Any, cfg: _PrintConfig) -> str:
+        """
+        render a bytes-like object as a hex and ascii preview of its first
+        cfg.buffer_window bytes. Only the previewed bytes are copied
+        """
+        try:
+            mv = memoryview(obj)
+            if mv.format != "B" or mv.ndim != 1:
+                mv = mv.cast("B")
+        except (TypeError, ValueError):
+            # Released or non-contiguous buffers
+            return str(obj)
+
+        if mv.nbytes <= cfg.buffer_window and not isinstance(obj, memoryview):
+            return str(obj)
+
+        window = mv[:cfg.buffer_window]
+        ellipsis = " ..." if mv.nbytes > cfg.buffer_window else ""
+        ascii_str = bytes(window).translate(_PRINTABLE_ASCII).decode("ascii")
+        return f"<{type(obj).__name__} len={mv.nbytes} {window.hex(' ')} |{ascii_str}|{ellipsis}>"
+
+    def _sample(self, obj: Any, cfg: _PrintConfig) -> List[Any]:
+        """
+        pick cfg.sample elements of obj. Sequences are sampled evenly spaced
+        by index, so only the sampled elements are accessed. Other containers
+        are reservoir sampled with cfg.seed
+        """
+        k = cfg.sample
+        total = len(obj)
+        if isinstance(obj, (list, tuple)):
+            return [obj[i * total // k] for i in range(k)]
+        return self._reservoir_sample(obj.items() if isinstance(obj, dict) else obj, cfg)
+
+    def _reservoir_sample(self, iterable: Iterable[Any], cfg: _PrintConfig) -> List[Any]:
+        """
+        pick cfg.sample elements of iterable in one pass, the result only
+        depends on the number of elements and cfg.seed
+        """
+        k = cfg.sample
+        # Algorithm L, skip the elements that won't be picked in C with islice
+        rng = random.Random(cfg.seed)
+        it = iter(iterable)
+        reservoir = list(itertools.islice(it, k))
+        if k == 0:
+            return reservoir
+        w = math.exp(math.log(1.0 - rng.random()) / k)
+        while w < 1.0:
+            skip = math.floor(math.log(1.0 - rng.random()) / math.log(1.0 - w))
+            picked = list(itertools.islice(it, skip, skip + 1))
+            if not picked:
+                break
+            reservoir[rng.randrange(k)] = picked[0]
+            w *= math.exp(math.log(1.0 - rng.random()) / k)
+        return reservoir
+
+    def _should_honor_existing(self, obj: Any, cfg: _PrintConfig) -> bool:
+        if not cfg.honor_existing:
+            return False
+        cls = obj.__class__
+        if cls.__str__ is not object.__str__:
+            return True
+        if cls.__repr__ is object.__repr__:
+            return False
+        # The __repr__ generated for dataclasses and attrs classes is not user defined
+        record = self._get_record_info(cls)
+        return record is None or not record.generated_repr
+
+    def _use_record_fields(self, cls: type, cfg: _PrintConfig) -> bool:
+        """
+        check if only the fields of a record class are printed, which is when
+        its generated renderer is used. Methods are not fields, so they are
+        found with the other attributes when they are printed
+        """
+        return not cfg.print_methods and self._get_record_info(cls) is not None
+
+    def _get_record_info(self, cls: type) -> Optional[RecordInfo]:
+        try:
+            return self._records[cls]
+        except KeyError:
+            record = self._records[cls] = get_record_info(cls)
+            return record
+
+    def _get_dict_items(self, obj: dict) -> List[Tuple[Any, Any]]:
+        items = [(key, val) for key, val in obj.items()]
+        try:
+            items = sorted(items)
+        except TypeError:
+            pass
+        return items
+
+    def _get_dict_item_str(
+            self,
+            key: Any,
+            val: Any,
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: _PrintConfig) -> Rendered:
+        stream_hook = cfg._stream_hook
+        if stream_hook is None:
+            return concat(self._objstr(key, None, indent_level, cfg), ": ", self._objstr(val, memo, indent_level, cfg))
+
+        # Keys are short, only the value streams
+        cfg._stream_hook = None
+        try:
+            key_str = self._objstr(key, None, indent_level, cfg)
+        finally:
+            cfg._stream_hook = stream_hook
+        return self._objstr_after(concat(key_str, ": "), val, memo, indent_level, cfg)
+
+    def _objstr_after(
+            self,
+            prefix: Rendered,
+            obj: Any,
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: _PrintConfig,
+            suffix: str = "") -> Rendered:
+        """
+        render obj between prefix and suffix. When streaming, the prefix is
+        written to the sink right before obj starts writing itself
+        """
+        stream_hook = cfg._stream_hook
+        if stream_hook is None:
+            return concat(prefix, self._objstr(obj, memo, indent_level, cfg), suffix)
+
+        cfg._stream_hook = PrefixHook(cfg._sink, stream_hook, prefix)  # type: ignore
+        try:
+            val = self._objstr(obj, memo, indent_level, cfg)
+        finally:
+            cfg._stream_hook = stream_hook
+        if val is STREAMED:
+            cfg._sink.write(suffix)  # type: ignore
+            return STREAMED
+        return concat(prefix, val, suffix)
+
+    def snapshot(self, obj: Any, file: Any = None, **kwargs) -> bytes:
+        """
+        capture obj into a compact binary snapshot, which can be rendered
+        later by render_snapshot(). The configs that select the attributes
+        are applied now, the ones of the layout are applied when rendering
+
+        :param file: a path or a binary file to write the snapshot to
+        """
+        cfg = self._configs.overwrite(**{**kwargs, "color": False, "backend": "text"})
+        data = SnapshotWriter(self, cfg).dumps(obj)
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, "wb") as f:
+                f.write(data)
+        elif file is not None:
+            file.write(data)
+        return data
+
+    def render_snapshot(self, snapshot: Any, format: str = "str", **kwargs) -> Any:
+        """
+        render a snapshot from snapshot() like objstr(), or like objjson()
+        if format is "json"
+
+        :param snapshot: the bytes of the snapshot, a path or a binary file
+        """
+        if isinstance(snapshot, (str, os.PathLike)):
+            with open(snapshot, "rb") as f:
+                data = f.read()
+        elif isinstance(snapshot, (bytes, bytearray, memoryview)):
+            data = bytes(snapshot)
+        else:
+            data = snapshot.read()
+
+        reader = SnapshotReader(self, data)
+        if format == "json":
+            return reader.objjson()
+        elif format != "str":
+            raise ValueError(f"format should be 'str' or 'json', not {format}")
+
+        for key in ("summary", "diff"):
+            if kwargs.get(key):
+                # The values are gone, only the rendering of the snapshot is kept
+                raise ValueError(f"{key} can't be applied when rendering a snapshot")
+        if "color" not in kwargs:
+            kwargs["color"] = False
+        cfg = self._configs.overwrite(**kwargs)
+        return self._get_document_str(reader.objstr(cfg), cfg)
+
     def objjson(self, obj: Any) -> Any:
         return self._objjson(obj, set())
 
@@ -209,73 +924,234 @@ class ObjPrint:
             return {key: self._objjson(val, memo.copy()) for key, val in obj.items()}
 
         # For generic object
+        fields = self._get_objprint_fields(obj)
+        if isinstance(fields, str):
+            return fields
+
         ret = {".type": type(obj).__name__}
 
-        if hasattr(obj, "__dict__"):
+        if fields is not None:
+            for key, val in fields:
+                ret[key] = self._objjson(val, memo.copy())
+        elif hasattr(obj, "__dict__"):
             for key, val in obj.__dict__.items():
                 ret[key] = self._objjson(val, memo.copy())
 
         return ret
 
-    def _get_custom_object_str(self, obj: Any, memo: Optional[Set[int]], indent_level: int, cfg: _PrintConfig):
+    def _get_custom_object_str(
+            self,
+            obj: Any,
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: _PrintConfig,
+            attr_names: Optional[Iterable[str]] = None) -> Rendered:
+
+        fields: Optional[Iterable[Tuple[str, Any]]] = None
+        if attr_names is None:
+            objprint_fields = self._get_objprint_fields(obj)
+            if isinstance(objprint_fields, str):
+                return self._get_lines_str(objprint_fields, indent_level, cfg)
+            fields = objprint_fields
+            if fields is None and self._use_record_fields(type(obj), cfg):
+                renderer = self._get_record_renderer(type(obj), cfg)
+                if renderer is not None:
+                    rendered = renderer(obj, memo, indent_level, cfg)
+                    if rendered is not None:
+                        return rendered
+
+        def _get_line(key: str, attr_val: Any) -> Rendered:
+            prefix, suffix = self._get_attr_prefix(key, cfg)
+            return self._objstr_after(prefix, attr_val, memo, indent_level + 1, cfg, suffix)
+
+        if fields is not None:
+            # The fields from __objprint__ are kept in their order
+            methods: List[Tuple[str, Any]] = []
+            attrs = [(key, val) for key, val in fields if self._match_attr(key, cfg)]
+        else:
+            methods, attrs = self._get_attrs(obj, cfg, attr_names)
 
-        def _get_method_line(attr: str) -> str:
-            try:
-                method_sig = str(inspect.signature(getattr(obj, attr)))
-            except ValueError:
-                # Please consider special handling
-                method_sig = "(<signature unknown>)"
+        elems = itertools.chain(
+            (self._get_method_line(attr, self._get_method_sig(method), cfg) for attr, method in methods),
+            (_get_line(key, attr_val) for key, attr_val in attrs)
+        )
 
-            if cfg.color:
-                return f"{set_color('def', COLOR.MAGENTA)} "\
-                    f"{set_color(attr, COLOR.GREEN)}{method_sig}"
-            else:
-                return f"def {attr}{method_sig}"
-
-        def _get_line(key: str) -> str:
-            val = self._objstr(getattr(obj, key), memo, indent_level + 1, cfg)
-            if cfg.label and any(re.fullmatch(pattern, key) is not None for pattern in cfg.label):
-                return set_color(f".{key} = {val}", COLOR.YELLOW)
-            elif cfg.color:
-                return f"{set_color('.' + key, COLOR.GREEN)} = {val}"
-            else:
-                return f".{key} = {val}"
+        return self._get_pack_str(elems, obj, indent_level, cfg)
+
+    def _get_method_sig(self, method: Any) -> str:
+        try:
+            return str(inspect.signature(method))
+        except ValueError:
+            # Please consider special handling
+            return "(<signature unknown>)"
+
+    def _get_method_line(self, attr: str, method_sig: str, cfg: _PrintConfig) -> str:
+        if cfg.color:
+            theme = cfg.theme
+            return f"{theme.def_keyword} {theme.wrap(theme.escape(attr), 'attr')}{theme.escape(method_sig)}"
+        else:
+            return f"def {attr}{method_sig}"
+
+    def _get_objprint_fields(self, obj: Any) -> Union[None, str, Iterable[Tuple[str, Any]]]:
+        """
+        call obj.__objprint__() if it's defined. It returns a str to print
+        as a whole, or an iterable of (name, value) to print as attributes
+        """
+        objprint_hook = getattr(type(obj), "__objprint__", None)
+        if objprint_hook is None:
+            return None
+        return objprint_hook(obj)
+
+    def _get_attr_prefix(self, key: str, cfg: _PrintConfig) -> Tuple[str, str]:
+        """
+        :return: (prefix, suffix) of the line of attribute key
+        """
+        if cfg.label and any(re.fullmatch(pattern, key) is not None for pattern in cfg.label):
+            prefix, suffix = cfg.theme.label
+            return f"{prefix}.{cfg.theme.escape(key)} = ", suffix
+        elif cfg.color:
+            return cfg.theme.attr_prefix(key), ""
+        else:
+            return f".{key} = ", ""
+
+    def _get_record_renderer(self, cls: type, cfg: _PrintConfig) -> Optional[RecordRenderer]:
+        """
+        get the generated renderer of a record class. It only depends on the
+        configs that decide which fields are printed and how the lines start
+        """
+        renderers = self._record_renderers.get(cls)
+        if renderers is None:
+            renderers = self._record_renderers.setdefault(cls, {})
+        key = (cfg.attr_pattern, tuple(cfg.include), tuple(cfg.exclude), tuple(cfg.label), cfg.color, cfg.theme)
+        try:
+            return renderers[key]
+        except KeyError:
+            pass
+        record = self._get_record_info(cls)
+        assert record is not None
+        lines = [
+            (field, *self._get_attr_prefix(field, cfg))
+            for field in sorted(record.fields) if self._match_attr(field, cfg)
+        ]
+        renderer = renderers[key] = compile_record_renderer(
+            cls, lines, self._objstr_after, self._get_pack_str
+        )
+        return renderer
+
+    def _get_attrs(
+            self,
+            obj: Any,
+            cfg: _PrintConfig,
+            attr_names: Optional[Iterable[str]] = None) -> Tuple[List[Tuple[str, Any]], List[Tuple[str, Any]]]:
+        """
+        find the attributes of obj to print, sorted by name
+
+        the value of each attribute is fetched exactly once here and carried
+        into rendering, so properties are never evaluated twice
+
+        :param attr_names: the names that already match the patterns, they
+                           are found from cfg if it's None
+        :return: (methods, attrs), both are lists of (name, value)
+        """
+        if attr_names is None:
+            attr_names = (attr for attr in self._get_attr_names(obj, cfg) if self._match_attr(attr, cfg))
 
         attrs = []
         methods = []
-        for attr in dir(obj):
-            if re.fullmatch(cfg.attr_pattern, attr):
-                if cfg.include:
-                    if not any((re.fullmatch(pattern, attr) is not None for pattern in cfg.include)):
-                        continue
-                if cfg.exclude:
-                    if any((re.fullmatch(pattern, attr) is not None for pattern in cfg.exclude)):
-                        continue
+        for attr in attr_names:
+            if not cfg.print_properties and self._is_computed_attr(obj, attr):
+                continue
 
-                try:
-                    attr_val = getattr(obj, attr)
-                except AttributeError:
+            try:
+                attr_val = getattr(obj, attr)
+            except AttributeError:
+                continue
+
+            if inspect.ismethod(attr_val) or inspect.isbuiltin(attr_val):
+                if cfg.print_methods:
+                    methods.append((attr, attr_val))
+            else:
+                attrs.append((attr, attr_val))
+
+        methods.sort(key=lambda item: item[0])
+        attrs.sort(key=lambda item: item[0])
+        return methods, attrs
+
+    def _match_attr(self, attr: str, cfg: _PrintConfig) -> bool:
+        if not re.fullmatch(cfg.attr_pattern, attr):
+            return False
+        if cfg.include and not any(re.fullmatch(pattern, attr) is not None for pattern in cfg.include):
+            return False
+        if cfg.exclude and any(re.fullmatch(pattern, attr) is not None for pattern in cfg.exclude):
+            return False
+        return True
+
+    def _get_attr_names(self, obj: Any, cfg: _PrintConfig) -> Iterable[str]:
+        """
+        list the candidate attribute names of obj based on cfg.attr_source
+
+        The fields of a record class are used when its generated renderer is,
+        regardless of cfg.attr_source. "dir" uses dir(obj), which covers the whole MRO. "instance" only reads
+        the instance __dict__ and the declared __slots__, so the cost is
+        proportional to the fields of the instance. "instance+class" also
+        includes the attributes defined on the classes, except object
+        """
+        if self._use_record_fields(type(obj), cfg):
+            record = self._get_record_info(type(obj))
+            assert record is not None
+            return record.fields
+
+        if cfg.attr_source == "dir":
+            return dir(obj)
+
+        names = dict.fromkeys(getattr(obj, "__dict__", ()))
+        mro = type(obj).__mro__
+        for cls in mro:
+            slots = cls.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            for slot in slots:
+                if slot in ("__dict__", "__weakref__"):
                     continue
+                if slot.startswith("__") and not slot.endswith("__"):
+                    # private slots are name mangled
+                    slot = f"_{cls.__name__.lstrip('_')}{slot}"
+                names[slot] = None
 
-                if inspect.ismethod(attr_val) or inspect.isbuiltin(attr_val):
-                    if cfg.print_methods:
-                        methods.append(attr)
-                else:
-                    attrs.append(attr)
+        if cfg.attr_source == "instance+class":
+            for cls in mro:
+                if cls is not object:
+                    names.update(dict.fromkeys(cls.__dict__))
 
-        elems = itertools.chain(
-            (_get_method_line(attr) for attr in sorted(methods)),
-            (_get_line(key) for key in sorted(attrs))
-        )
+        return names
 
-        return self._get_pack_str(elems, obj, indent_level, cfg)
+    def _is_computed_attr(self, obj: Any, attr: str) -> bool:
+        """
+        check if attr is a property or another descriptor defined on the
+        class that computes the value, without evaluating it. Members defined
+        by __slots__ are regular fields, so are methods. A non-data descriptor
+        like functools.cached_property is computed until its value is stored
+        in the instance __dict__
+        """
+        for cls in type(obj).__mro__:
+            if attr in cls.__dict__:
+                class_attr = cls.__dict__[attr]
+                if isinstance(class_attr, _NOT_COMPUTED_DESCRIPTORS):
+                    return False
+                descr_type = type(class_attr)
+                if hasattr(descr_type, "__set__") or hasattr(descr_type, "__delete__"):
+                    return True
+                if hasattr(descr_type, "__get__"):
+                    return attr not in getattr(obj, "__dict__", {})
+                return False
+        return False
 
     def _get_line_number_str(self, curr_frame: Optional[FrameType], cfg: _PrintConfig):
         if curr_frame is None:
             return "Unknown Line Number"
         curr_code = curr_frame.f_code
         if cfg.color:
-            return f"{set_color(curr_code.co_name, COLOR.GREEN)} ({curr_code.co_filename}:{curr_frame.f_lineno})"
+            return f"{cfg.theme.wrap(curr_code.co_name, 'line_number')} ({curr_code.co_filename}:{curr_frame.f_lineno})"
         else:
             return f"{curr_code.co_name} ({curr_code.co_filename}:{curr_frame.f_lineno})"
 
@@ -288,6 +1164,9 @@ class ObjPrint:
     def config(self, **kwargs) -> None:
         self._configs.set(**kwargs)
 
+    def clear_diff(self) -> None:
+        self.differ.clear()
+
     def install(self, name: str = "op") -> None:
         import builtins
         builtins.__dict__[name] = self
@@ -304,12 +1183,17 @@ class ObjPrint:
     def register_formatter(
         self,
         obj_type: Type[Any],
-        obj_formatter: Optional[Callable[[Any], str]] = None,
-        inherit: bool = True
-    ) -> Optional[Callable[[Callable[[Any], str]], Callable[[Any], str]]]:
+        obj_formatter: Optional[Callable[..., str]] = None,
+        inherit: bool = True,
+        context: bool = False
+    ) -> Optional[Callable[[Callable[..., str]], Callable[..., str]]]:
+        """
+        :param context: if True, the formatter is called with (obj, ctx), ctx
+                        is a RenderContext to render the children of obj
+        """
         if obj_formatter is None:
-            def wrapper(obj_formatter: Callable[[Any], str]) -> Callable[[Any], str]:
-                self.register_formatter(obj_type, obj_formatter, inherit)
+            def wrapper(obj_formatter: Callable[..., str]) -> Callable[..., str]:
+                self.register_formatter(obj_type, obj_formatter, inherit, context)
                 return obj_formatter
             return wrapper
 
@@ -319,17 +1203,24 @@ class ObjPrint:
         if not callable(obj_formatter):
             raise TypeError("obj_formatter must be a callable")
 
-        fmt_info = self.FormatterInfo(formatter=obj_formatter, inherit=inherit)
-        self.type_formatter[obj_type] = fmt_info
+        fmt_info = self.FormatterInfo(formatter=obj_formatter, inherit=inherit, context=context)
+        with self._formatter_lock:
+            type_formatter = dict(self.type_formatter)
+            type_formatter[obj_type] = fmt_info
+            self.type_formatter = type_formatter
+            self._resolved_formatters = (abc.get_cache_token(), weakref.WeakKeyDictionary())
         return None
 
     def unregister_formatter(self, *obj_types: Type[Any]) -> None:
-        if not obj_types:
-            self.type_formatter.clear()
-        else:
-            for obj_type in obj_types:
-                if obj_type in self.type_formatter:
-                    del self.type_formatter[obj_type]
+        with self._formatter_lock:
+            if not obj_types:
+                type_formatter = {}
+            else:
+                type_formatter = dict(self.type_formatter)
+                for obj_type in obj_types:
+                    type_formatter.pop(obj_type, None)
+            self.type_formatter = type_formatter
+            self._resolved_formatters = (abc.get_cache_token(), weakref.WeakKeyDictionary())
 
     def get_formatter(self) -> dict:
         return self.type_formatter
@@ -340,10 +1231,13 @@ class ObjPrint:
             indicator = self.indicator_map[obj_type]
             return indicator[0], indicator[1]
         else:
-            if cfg.color:
-                return set_color(f"<{obj_type.__name__} {hex(id(obj))}", COLOR.CYAN), set_color(">", COLOR.CYAN)
-            else:
-                return f"<{obj_type.__name__} {hex(id(obj))}", ">"
+            return self._get_object_header_footer(obj_type.__name__, id(obj), cfg)
+
+    def _get_object_header_footer(self, type_name: str, obj_id: int, cfg: _PrintConfig) -> Tuple[str, str]:
+        if cfg.color:
+            return cfg.theme.get_header(type_name, hex(obj_id)), cfg.theme.footer
+        else:
+            return f"<{type_name} {hex(obj_id)}", ">"
 
     def _get_ellipsis(self, obj: Any, cfg: _PrintConfig) -> str:
         header, footer = self._get_header_footer(obj, cfg)
@@ -351,21 +1245,27 @@ class ObjPrint:
 
     def _get_pack_str(
             self,
-            elems: Iterable[str],
+            elems: Iterable[Rendered],
             obj: Any,
             indent_level: int,
-            cfg: _PrintConfig) -> str:
+            cfg: _PrintConfig,
+            header_footer: Optional[Tuple[str, str]] = None) -> Rendered:
         """
         :param elems generator: generator of string elements to pack together
         :param obj_type type: object type
         :param indent_level int: current indent level
+        :param header_footer tuple: the header and footer, they are found
+                                    from obj if it's None
         """
-        header, footer = self._get_header_footer(obj, cfg)
+        header, footer = header_footer or self._get_header_footer(obj, cfg)
+
+        if cfg._stream_hook is not None:
+            return self._get_pack_stream(elems, header, footer, indent_level, cfg)
 
         if cfg.elements == -1:
             elems = list(elems)
         else:
-            first_elems = []
+            first_elems: List[Rendered] = []
             it = iter(elems)
             try:
                 for _ in range(cfg.elements):
@@ -376,19 +1276,101 @@ class ObjPrint:
                 first_elems.append("...")
             elems = first_elems
 
-        multiline = False
-        if len(header) > 1 and len(elems) > 0:
-            # If it's not built in, always do multiline
-            multiline = True
-        elif any(("\n" in elem for elem in elems)):
-            # Has \n, need multiple mode
-            multiline = True
-        elif cfg.width is not None and sum((len(elem) for elem in elems)) > cfg.width:
-            multiline = True
+        # If it's not built in, always do multiline. Otherwise it's multiline
+        # when any element has \n, or when the elements are longer than the
+        # width in total. Once it's decided, the rest are not checked
+        multiline = len(header) > 1
+        budget = cfg.width
+        for elem in elems:
+            if multiline:
+                break
+            if isinstance(elem, Fragment):
+                multiline = True
+            else:
+                # Check the length first so we never scan more than the
+                # width for \n. The markup of the colors takes no width
+                budget -= cfg.theme.get_width(elem) if cfg.color else len(elem)
+                multiline = budget < 0 or "\n" in elem
+        multiline = multiline and len(elems) > 0
 
         if multiline:
-            s = ",\n".join(self.add_indent(elems, indent_level + 1, cfg))
-            return f"{header}\n{s}\n{self.add_indent('', indent_level, cfg)}{footer}"
+            if cfg.color and cfg.theme.collapsible:
+                header, footer = cfg.theme.collapse(header, footer, cfg.expand == -1 or indent_level < cfg.expand)
+            # The elements are referenced by the fragment, not copied
+            indent = self.add_indent("", indent_level + 1, cfg)
+            parts: List[Rendered] = [",\n" + indent] * (2 * len(elems) + 1)
+            parts[0] = f"{header}\n{indent}"
+            parts[1::2] = elems
+            parts[-1] = f"\n{self.add_indent('', indent_level, cfg)}{footer}"
+            return Fragment(parts)
         else:
-            s = ", ".join(elems)
+            # A single line is short, join it directly
+            s = ", ".join(elems)  # type: ignore
             return f"{header}{s}{footer}"
+
+    def _get_pack_stream(
+            self,
+            elems: Iterable[Rendered],
+            header: str,
+            footer: str,
+            indent_level: int,
+            cfg: _PrintConfig) -> Rendered:
+        """
+        the streaming version of _get_pack_str(), the multiline decision is
+        the same. Once the pack is multiline, it's written to the sink and
+        STREAMED is returned
+        """
+        stream_hook = cfg._stream_hook
+        assert stream_hook is not None and cfg._sink is not None
+        custom = len(header) > 1
+        if cfg.color and cfg.theme.collapsible:
+            # The header and footer of the multiline pack
+            ml_header, ml_footer = cfg.theme.collapse(header, footer, cfg.expand == -1 or indent_level < cfg.expand)
+        else:
+            ml_header, ml_footer = header, footer
+        pack = PackStream(cfg._sink, stream_hook, ml_header, self.add_indent("", indent_level + 1, cfg))
+        budget = cfg.width
+        count = 0
+
+        it = iter(elems)
+        cfg._stream_hook = pack.child_hook
+        try:
+            for elem in (it if cfg.elements == -1 else itertools.islice(it, cfg.elements)):
+                count += 1
+                if not pack.multiline:
+                    if custom or isinstance(elem, Fragment):
+                        pack.multiline = True
+                    else:
+                        budget -= cfg.theme.get_width(elem) if cfg.color else len(elem)
+                        pack.multiline = budget < 0 or "\n" in elem
+                    pack.add(elem)
+                    if pack.multiline:
+                        pack.stream()
+                else:
+                    pack.add(elem)
+
+            if cfg.elements != -1 and count == cfg.elements:
+                # The extra element is only rendered to know it's there
+                cfg._stream_hook = None
+                if next(it, None) is not None:
+                    if not pack.multiline:
+                        pack.multiline = custom or budget - 3 < 0
+                    pack.add("...")
+                    if pack.multiline:
+                        pack.stream()
+        finally:
+            cfg._stream_hook = stream_hook
+
+        if pack.streaming:
+            cfg._sink.write(f"\n{self.add_indent('', indent_level, cfg)}{ml_footer}")
+            return STREAMED
+
+        elems = pack.pending
+        if pack.multiline and elems:
+            parts: List[Rendered] = [pack.sep] * (2 * len(elems) + 1)
+            parts[0] = f"{ml_header}\n{pack.indent}"
+            parts[1::2] = elems
+            parts[-1] = f"\n{self.add_indent('', indent_level, cfg)}{ml_footer}"
+            return Fragment(parts)
+        s = ", ".join(elems)  # type: ignore
+        return f"{header}{s}{footer}"
@@ -0,0 +1,86 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+from collections import namedtuple
+import dataclasses
+import inspect
+import keyword
+from types import BuiltinFunctionType, MethodType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+# The classes with a static list of fields: dataclasses, attrs classes
+# and NamedTuples. generated_repr is True if __repr__ is the generated one
+RecordInfo = namedtuple("RecordInfo", ["fields", "generated_repr"])
+
+RecordRenderer = Callable[..., Any]
+
+
+def get_record_info(cls: type) -> Optional[RecordInfo]:
+    """
+    find the fields to print of a record class. Only the class that's
+    decorated itself is a record, a subclass may have more attributes
+    """
+    cls_dict = cls.__dict__
+    if "__dataclass_fields__" in cls_dict:
+        fields = tuple(field.name for field in dataclasses.fields(cls) if field.repr)
+    elif "__attrs_attrs__" in cls_dict:
+        fields = tuple(attr.name for attr in getattr(cls, "__attrs_attrs__") if attr.repr is not False)
+    elif issubclass(cls, tuple) and "_fields" in cls_dict:
+        fields = tuple(getattr(cls, "_fields"))
+    else:
+        return None
+    return RecordInfo(fields=fields, generated_repr=is_generated_repr(cls.__repr__))
+
+
+def is_generated_repr(func: Any) -> bool:
+    func = inspect.unwrap(func)
+    code = getattr(func, "__code__", None)
+    if code is None:
+        return False
+    # dataclasses create the functions in __create_fn__, attrs compiles
+    # them with a special file name
+    return "__create_fn__" in func.__qualname__ or code.co_filename.startswith("<attrs generated")
+
+
+def compile_record_renderer(
+        cls: type,
+        lines: List[Tuple[str, str, str]],
+        objstr_after: Callable[..., Any],
+        get_pack_str: Callable[..., Any]) -> Optional[RecordRenderer]:
+    """
+    generate the render function of a record class, like dataclasses
+    generate __init__. lines are (field, prefix, suffix) sorted by field
+
+    The function returns None if a field is missing or is a method, so the
+    caller can fall back to the generic path
+    """
+    if any(not field.isidentifier() or keyword.iskeyword(field) for field, _, _ in lines):
+        return None
+
+    namespace: Dict[str, Any] = {
+        "after": objstr_after,
+        "pack": get_pack_str,
+        "method_types": (MethodType, BuiltinFunctionType),
+    }
+    fetch = [f"        v{idx} = obj.{field}" for idx, (field, _, _) in enumerate(lines)]
+    check = " or ".join(f"type(v{idx}) in method_types" for idx in range(len(lines)))
+    yields = []
+    for idx, (_, prefix, suffix) in enumerate(lines):
+        namespace[f"prefix{idx}"] = prefix
+        namespace[f"suffix{idx}"] = suffix
+        yields.append(f"        yield after(prefix{idx}, v{idx}, memo, level, cfg, suffix{idx})")
+
+    src = "\n".join([
+        "def __objprint_render__(obj, memo, indent_level, cfg):",
+        "    try:",
+        *(fetch or ["        pass"]),
+        "    except AttributeError:",
+        "        return None",
+        *([f"    if {check}:", "        return None"] if check else []),
+        "    def elems(level=indent_level + 1):",
+        *(yields or ["        yield from ()"]),
+        "    return pack(elems(), obj, indent_level, cfg)",
+    ])
+    exec(compile(src, f"<objprint generated renderer {cls.__qualname__}>", "exec"), namespace)
+    return namespace["__objprint_render__"]
@@ -0,0 +1,521 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+import array
+import itertools
+import struct
+import sys
+import zlib
+from types import FunctionType
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .fragment import Rendered, concat
+from .summary import summarize
+
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .objprint import ObjPrint, _PrintConfig
+
+
+MAGIC = b"OPSNAP"
+VERSION = 2
+
+# A snapshot is MAGIC, a byte of VERSION, then the zlib compressed encoding
+# of the tables of the nodes, see dumps(). The encoding doesn't depend on the
+# Python version, unlike marshal or pickle.
+# types and names are the interned type names and attribute names. A node is
+# a str, int, float, bool or None for a builtin scalar, otherwise it's
+#   (type index, id, text kind, text a, text b, json kind, json data)
+# Nodes refer to each other by their index in nodes, so every object is only
+# kept once and recursive objects are fine.
+
+# The text kinds, how objstr renders the node
+TEXT_RAW = 0        # a: the text, printed as it is
+TEXT_LINES = 1      # a: the text, the following lines are indented
+TEXT_SEQ = 2        # a: the elements, b: True for a set, which is sampled randomly
+TEXT_DICT = 3       # a: the keys and values, b: the order of the items or None
+TEXT_OBJECT = 4     # a: the names and signatures of methods, b: the names and values of attributes
+
+# The json kinds, what objjson returns for the node
+JSON_STR = 0        # data: the str
+JSON_ARRAY = 1      # data: the elements, None if they are the same as text a
+JSON_DICT = 2       # data: the keys and values, None if they are the same as text a
+JSON_OBJECT = 3     # data: the names and values of the fields
+JSON_VALUE = 4      # data: the scalar value of a subclass of the scalars
+JSON_FIELDS = 5     # data: the order of the attributes in text b as the fields, None if it's the same
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class SnapshotWriter:
+    """
+    Capture the object graph of obj into a snapshot, with the attributes that
+    objstr would print with cfg, and the fields that objjson would return
+    """
+    def __init__(self, printer: "ObjPrint", cfg: "_PrintConfig") -> None:
+        self.printer = printer
+        self.cfg = cfg
+        self.types: List[str] = []
+        self.type_index: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.name_index: Dict[str, int] = {}
+        self.nodes: List[Any] = []
+        self.refs: Dict[int, int] = {}
+        self.scalar_refs: Dict[Tuple[type, Any], int] = {}
+        # The config never changes during the capture, so the result of the
+        # attribute patterns is kept for every name
+        self.matched: Dict[str, bool] = {}
+        # Keep the captured objects alive so their ids can't be reused
+        self.objs: List[Any] = []
+
+    def dumps(self, obj: Any) -> bytes:
+        root = self.capture(obj, 0)
+        return dumps(self.types, self.names, self.nodes, root)
+
+    def intern_type(self, type_name: str) -> int:
+        idx = self.type_index.get(type_name)
+        if idx is None:
+            idx = self.type_index[type_name] = len(self.types)
+            self.types.append(type_name)
+        return idx
+
+    def intern_name(self, name: str) -> int:
+        idx = self.name_index.get(name)
+        if idx is None:
+            idx = self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return idx
+
+    def capture(self, obj: Any, indent_level: int) -> int:
+        if type(obj) in _SCALAR_TYPES and not self._has_formatter(obj):
+            key = (type(obj), obj)
+            try:
+                return self.scalar_refs[key]
+            except KeyError:
+                ref = self.scalar_refs[key] = len(self.nodes)
+                self.nodes.append(obj)
+                return ref
+
+        known = self.refs.get(id(obj))
+        if known is not None:
+            return known
+        ref = self.refs[id(obj)] = len(self.nodes)
+        self.nodes.append(None)
+        self.objs.append(obj)
+
+        text_kind, text_a, text_b = self._capture_text(obj, indent_level)
+        json_kind, json_data = self._capture_json(obj, text_kind, text_b, indent_level)
+        # The id is only printed in the headers of the objects
+        obj_id = id(obj) if type(obj) not in self.printer.indicator_map else None
+        self.nodes[ref] = (self.intern_type(type(obj).__name__), obj_id, text_kind, text_a, text_b, json_kind, json_data)
+        return ref
+
+    def _has_formatter(self, obj: Any) -> bool:
+        printer = self.printer
+        return bool(printer.type_formatter) and printer._find_formatter(type(obj)) is not None
+
+    def _capture_text(self, obj: Any, indent_level: int) -> Tuple[int, Any, Any]:
+        """
+        follow the decisions of ObjPrint._objstr()
+        """
+        printer = self.printer
+        cfg = self.cfg
+        if self._has_formatter(obj):
+            # Formatters are applied when the snapshot is taken
+            memo: Optional[Set[int]] = set() if cfg.skip_recursion else None
+            return TEXT_RAW, str(printer._objstr(obj, memo, indent_level, cfg)), None
+
+        if cfg.summary:
+            summary = summarize(obj)
+            if summary is not None:
+                return TEXT_RAW, summary, None
+
+        if isinstance(obj, (str, int, float)):
+            # A subclass of the scalars
+            return TEXT_RAW, str(printer._objstr(obj, None, indent_level, cfg)), None
+        elif isinstance(obj, FunctionType):
+            return TEXT_RAW, f"<function {obj.__name__}>", None
+        elif cfg.honor_existing and isinstance(obj, (bytes, bytearray, memoryview)):
+            return TEXT_RAW, printer._get_buffer_str(obj, cfg), None
+
+        if isinstance(obj, tuple) and type(obj) is not tuple and printer._get_record_info(type(obj)) is not None:
+            return self._capture_object(obj, None, indent_level)
+        elif isinstance(obj, (list, tuple, set)):
+            return TEXT_SEQ, [self.capture(val, indent_level + 1) for val in obj], isinstance(obj, set) or None
+        elif isinstance(obj, dict):
+            items = list(obj.items())
+            data = []
+            for key, val in items:
+                data.append(self.capture(key, indent_level + 1))
+                data.append(self.capture(val, indent_level + 1))
+            order = None
+            sorted_items = printer._get_dict_items(obj)
+            if any(item[0] is not key for item, (key, _) in zip(sorted_items, items)):
+                positions = {id(key): idx for idx, (key, _) in enumerate(items)}
+                order = [positions[id(key)] for key, _ in sorted_items]
+            return TEXT_DICT, data, order
+
+        if not hasattr(type(obj), "__objprint__") and printer._should_honor_existing(obj, cfg):
+            return TEXT_LINES, str(obj), None
+        fields = printer._get_objprint_fields(obj)
+        if isinstance(fields, str):
+            return TEXT_LINES, fields, None
+        return self._capture_object(obj, fields, indent_level)
+
+    def _capture_object(self, obj: Any, fields: Any, indent_level: int) -> Tuple[int, Any, Any]:
+        printer = self.printer
+        cfg = self.cfg
+        if fields is not None:
+            methods: List[Tuple[str, Any]] = []
+            attrs = [(key, val) for key, val in fields if self._match(key)]
+        else:
+            attr_names = [name for name in printer._get_attr_names(obj, cfg) if self._match(name)]
+            methods, attrs = printer._get_attrs(obj, cfg, attr_names)
+
+        method_data: List[Any] = []
+        for name, method in methods:
+            method_data.append(self.intern_name(name))
+            method_data.append(printer._get_method_sig(method))
+        attr_data = []
+        for name, val in attrs:
+            attr_data.append(self.intern_name(name))
+            attr_data.append(self.capture(val, indent_level + 1))
+        return TEXT_OBJECT, method_data, attr_data
+
+    def _match(self, name: str) -> bool:
+        matched = self.matched.get(name)
+        if matched is None:
+            matched = self.matched[name] = self.printer._match_attr(name, self.cfg)
+        return matched
+
+    def _capture_json(self, obj: Any, text_kind: int, text_b: Any, indent_level: int) -> Tuple[int, Any]:
+        """
+        follow the decisions of ObjPrint._objjson()
+        """
+        if isinstance(obj, _SCALAR_TYPES):
+            # A subclass of the scalars, or a scalar with a formatter
+            return JSON_VALUE, obj if type(obj) in _SCALAR_TYPES else _get_scalar_value(obj)
+        if isinstance(obj, (list, tuple)):
+            if text_kind == TEXT_SEQ:
+                return JSON_ARRAY, None
+            return JSON_ARRAY, [self.capture(val, indent_level + 1) for val in obj]
+        if isinstance(obj, dict):
+            if text_kind == TEXT_DICT:
+                return JSON_DICT, None
+            data = []
+            for key, val in obj.items():
+                data.append(self.capture(key, indent_level + 1))
+                data.append(self.capture(val, indent_level + 1))
+            return JSON_DICT, data
+
+        fields = self.printer._get_objprint_fields(obj)
+        if isinstance(fields, str):
+            return JSON_STR, fields
+        if fields is None:
+            fields = obj.__dict__.items() if hasattr(obj, "__dict__") else ()
+        data = []
+        for name, val in fields:
+            data.append(self.intern_name(name))
+            data.append(self.capture(val, indent_level + 1))
+
+        if text_kind == TEXT_OBJECT and len(data) == len(text_b):
+            # The fields are usually the attributes in another order
+            positions = {(text_b[idx], text_b[idx + 1]): idx // 2 for idx in range(0, len(text_b), 2)}
+            order = [positions.get((data[idx], data[idx + 1]), -1) for idx in range(0, len(data), 2)]
+            if -1 not in order and len(set(order)) == len(order):
+                return JSON_FIELDS, order if order != sorted(order) else None
+        return JSON_OBJECT, data
+
+
+def _get_scalar_value(obj: Any) -> Any:
+    for scalar_type in (bool, int, float, str):
+        if isinstance(obj, scalar_type):
+            return scalar_type(obj) if scalar_type is not str else str.__str__(obj)
+    return obj
+
+
+# The tags of the encoded values, followed by
+_TAG_NONE = b"N"        # nothing
+_TAG_TRUE = b"T"        # nothing
+_TAG_FALSE = b"F"       # nothing
+_TAG_INT = b"i"         # a signed 64-bit int
+_TAG_BIGINT = b"I"      # the number of bytes as an unsigned 32-bit int, then the signed bytes of the int
+_TAG_FLOAT = b"d"       # a 64-bit float
+_TAG_STR = b"s"         # the number of bytes, then the utf-8 of the str
+_TAG_BYTES = b"b"       # the number of bytes, then the bytes
+_TAG_LIST = b"l"        # the number of elements, then the elements
+_TAG_TUPLE = b"t"       # the number of elements, then the elements
+_TAG_INTS = b"a"        # the number of elements, then the elements as signed 64-bit ints, for a list of ints
+
+# All the numbers are little-endian
+_INT = struct.Struct("<q")
+_UINT = struct.Struct("<I")
+_FLOAT = struct.Struct("<d")
+_INT_MIN, _INT_MAX = -(1 << 63), (1 << 63) - 1
+
+
+def _encode(value: Any, parts: List[bytes]) -> None:
+    """
+    append the encoding of value to parts. value is built from None, bool,
+    int, float, str, bytes, list and tuple
+    """
+    value_type = type(value)
+    if value_type is int:
+        if _INT_MIN <= value <= _INT_MAX:
+            parts.append(_TAG_INT + _INT.pack(value))
+        else:
+            size = (value.bit_length() + 8) // 8
+            parts.append(_TAG_BIGINT + _UINT.pack(size) + value.to_bytes(size, "little", signed=True))
+    elif value_type is str:
+        encoded = value.encode("utf-8", "surrogatepass")
+        parts.append(_TAG_STR + _UINT.pack(len(encoded)) + encoded)
+    elif value_type is bytes:
+        parts.append(_TAG_BYTES + _UINT.pack(len(value)) + value)
+    elif value_type is list or value_type is tuple:
+        if value_type is list and value and set(map(type, value)) == {int}:
+            # Most of the lists are the refs of the nodes, pack them at once
+            try:
+                ints = array.array("q", value)
+            except OverflowError:
+                pass
+            else:
+                if sys.byteorder != "little":  # pragma: no cover
+                    ints.byteswap()
+                parts.append(_TAG_INTS + _UINT.pack(len(value)) + ints.tobytes())
+                return
+        parts.append((_TAG_LIST if value_type is list else _TAG_TUPLE) + _UINT.pack(len(value)))
+        for elem in value:
+            _encode(elem, parts)
+    elif value is None:
+        parts.append(_TAG_NONE)
+    elif value is True:
+        parts.append(_TAG_TRUE)
+    elif value is False:
+        parts.append(_TAG_FALSE)
+    elif value_type is float:
+        parts.append(_TAG_FLOAT + _FLOAT.pack(value))
+    else:  # pragma: no cover
+        raise TypeError(f"Can't encode {value_type.__name__} in a snapshot")
+
+
+class _Decoder:
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.pos = 0
+
+    def _unpack(self, fmt: struct.Struct) -> Any:
+        value = fmt.unpack_from(self.data, self.pos)[0]
+        self.pos += fmt.size
+        return value
+
+    def _read(self, size: int) -> bytes:
+        if self.pos + size > len(self.data):
+            raise ValueError("Truncated snapshot")
+        value = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return value
+
+    def decode(self) -> Any:
+        tag = self._read(1)
+        if tag == _TAG_INT:
+            return self._unpack(_INT)
+        elif tag == _TAG_STR:
+            return self._read(self._unpack(_UINT)).decode("utf-8", "surrogatepass")
+        elif tag == _TAG_BYTES:
+            return self._read(self._unpack(_UINT))
+        elif tag == _TAG_INTS:
+            ints = array.array("q")
+            ints.frombytes(self._read(self._unpack(_UINT) * ints.itemsize))
+            if sys.byteorder != "little":  # pragma: no cover
+                ints.byteswap()
+            return ints.tolist()
+        elif tag == _TAG_LIST:
+            return [self.decode() for _ in range(self._unpack(_UINT))]
+        elif tag == _TAG_TUPLE:
+            return tuple(self.decode() for _ in range(self._unpack(_UINT)))
+        elif tag == _TAG_NONE:
+            return None
+        elif tag == _TAG_TRUE:
+            return True
+        elif tag == _TAG_FALSE:
+            return False
+        elif tag == _TAG_FLOAT:
+            return self._unpack(_FLOAT)
+        elif tag == _TAG_BIGINT:
+            return int.from_bytes(self._read(self._unpack(_UINT)), "little", signed=True)
+        raise ValueError(f"Unknown tag {tag!r}")
+
+
+def dumps(types: List[str], names: List[str], nodes: List[Any], root: int) -> bytes:
+    """
+    encode the nodes as tables. The fields of the object nodes are stored by
+    column, so the ints are packed together and nothing is encoded per node
+    """
+    objs = [node for node in nodes if type(node) is tuple]
+    columns = [list(column) for column in zip(*objs)] if objs else [[] for _ in range(7)]
+    # The ids are never negative, -1 is None
+    columns[1] = [-1 if obj_id is None else obj_id for obj_id in columns[1]]
+    tables = (
+        types,
+        names,
+        root,
+        bytes(type(node) is tuple for node in nodes),
+        [node for node in nodes if type(node) is not tuple],
+        columns,
+    )
+    parts: List[bytes] = []
+    _encode(tables, parts)
+    # The nodes repeat a lot, fast compression makes them several times smaller
+    return MAGIC + bytes((VERSION,)) + zlib.compress(b"".join(parts), 1)
+
+
+def loads(data: bytes) -> Tuple[List[str], List[str], List[Any], int]:
+    if not data.startswith(MAGIC):
+        raise ValueError("Not an objprint snapshot")
+    if len(data) == len(MAGIC):
+        raise ValueError("Corrupted objprint snapshot")
+    version = data[len(MAGIC)]
+    if version != VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+    try:
+        payload = zlib.decompress(data[len(MAGIC) + 1:])
+        decoder = _Decoder(payload)
+        types, names, root, is_obj, scalars, columns = decoder.decode()
+        if decoder.pos != len(payload) or len(columns) != 7 or len(is_obj) != len(scalars) + len(columns[0]) or \
+                any(len(column) != len(columns[0]) for column in columns) or not 0 <= root < len(is_obj):
+            raise ValueError("Inconsistent tables")
+        columns[1] = [None if obj_id == -1 else obj_id for obj_id in columns[1]]
+        obj_it = zip(*columns)
+        scalar_it = iter(scalars)
+        nodes = [next(obj_it) if flag else next(scalar_it) for flag in is_obj]
+    except (ValueError, TypeError, RecursionError, struct.error, zlib.error):
+        raise ValueError("Corrupted objprint snapshot") from None
+    return types, names, nodes, root
+
+
+class SnapshotReader:
+    """
+    Render a snapshot the same way as objstr and objjson render the object
+    """
+    def __init__(self, printer: "ObjPrint", data: bytes) -> None:
+        self.printer = printer
+        self.types, self.names, self.nodes, self.root = loads(data)
+        self.indicators = {obj_type.__name__: indicator for obj_type, indicator in printer.indicator_map.items()}
+
+    def objstr(self, cfg: "_PrintConfig") -> Rendered:
+        memo: Optional[Set[int]] = set() if cfg.skip_recursion else None
+        return self._objstr(self.root, memo, 0, cfg)
+
+    def _get_header_footer(self, node: tuple, cfg: "_PrintConfig") -> Tuple[str, str]:
+        type_name = self.types[node[0]]
+        if node[2] in (TEXT_SEQ, TEXT_DICT) and type_name in self.indicators:
+            indicator = self.indicators[type_name]
+            return indicator[0], indicator[1]
+        return self.printer._get_object_header_footer(type_name, node[1], cfg)
+
+    def _objstr(self, ref: int, memo: Optional[Set[int]], indent_level: int, cfg: "_PrintConfig") -> Rendered:
+        printer = self.printer
+        node = self.nodes[ref]
+        if not isinstance(node, tuple):
+            return printer._objstr(node, None, indent_level, cfg)
+
+        _, _, text_kind, text_a, text_b, _, _ = node
+        if text_kind == TEXT_RAW:
+            return cfg.theme.escape(text_a) if cfg.color else text_a
+
+        if (memo is not None and ref in memo) or indent_level >= cfg.depth or \
+                (cfg.max_nodes != -1 and not printer._take_node(cfg)):
+            header, footer = self._get_header_footer(node, cfg)
+            return f"{header} ... {footer}"
+
+        if text_kind == TEXT_LINES:
+            return printer._get_lines_str(text_a, indent_level, cfg)
+
+        if memo is not None:
+            memo = memo | {ref}
+
+        elems: Iterable[Rendered]
+        if text_kind == TEXT_SEQ:
+            refs = text_a
+            total = len(refs)
+            if cfg.sample != -1 and total > cfg.sample:
+                refs = printer._reservoir_sample(refs, cfg) if text_b else printer._sample(refs, cfg)
+            elems = (self._objstr(val, memo, indent_level + 1, cfg) for val in refs)
+        elif text_kind == TEXT_DICT:
+            order = text_b if text_b is not None else range(len(text_a) // 2)
+            total = len(order)
+            if cfg.sample != -1 and total > cfg.sample:
+                # The items are sampled in the order of the dict, then printed in the sorted order
+                positions = {idx: pos for pos, idx in enumerate(order)}
+                order = sorted(printer._reservoir_sample(range(len(order)), cfg), key=positions.__getitem__)
+            elems = (
+                concat(self._objstr(text_a[2 * idx], None, indent_level + 1, cfg), ": ",
+                       self._objstr(text_a[2 * idx + 1], memo, indent_level + 1, cfg))
+                for idx in order
+            )
+        else:
+            total = -1
+            elems = self._get_object_lines(text_a, text_b, memo, indent_level, cfg)
+
+        if cfg.sample != -1 and total > cfg.sample:
+            elems = itertools.chain(elems, (f"... ({total} in total)",))
+
+        return printer._get_pack_str(elems, None, indent_level, cfg, self._get_header_footer(node, cfg))
+
+    def _get_object_lines(
+            self,
+            methods: List[Any],
+            attrs: List[Any],
+            memo: Optional[Set[int]],
+            indent_level: int,
+            cfg: "_PrintConfig") -> Iterator[Rendered]:
+        printer = self.printer
+        names = self.names
+        for idx in range(0, len(methods), 2):
+            yield printer._get_method_line(names[methods[idx]], methods[idx + 1], cfg)
+        for idx in range(0, len(attrs), 2):
+            prefix, suffix = printer._get_attr_prefix(names[attrs[idx]], cfg)
+            yield concat(prefix, self._objstr(attrs[idx + 1], memo, indent_level + 1, cfg), suffix)
+
+    def objjson(self) -> Any:
+        return self._objjson(self.root, set())
+
+    def _objjson(self, ref: int, memo: Set[int]) -> Any:
+        node = self.nodes[ref]
+        if not isinstance(node, tuple):
+            return node
+
+        type_idx, _, text_kind, text_a, _, json_kind, json_data = node
+        if json_kind == JSON_VALUE:
+            return json_data
+
+        if ref in memo:
+            raise ValueError("Can't jsonify a recursive object")
+        memo.add(ref)
+
+        if json_kind == JSON_ARRAY:
+            return [self._objjson(val, memo.copy()) for val in (text_a if json_data is None else json_data)]
+        if json_kind == JSON_DICT:
+            data = text_a if json_data is None else json_data
+            return {
+                self._get_json_key(data[idx]): self._objjson(data[idx + 1], memo.copy())
+                for idx in range(0, len(data), 2)
+            }
+        if json_kind == JSON_STR:
+            return json_data
+        if json_kind == JSON_FIELDS:
+            attrs = node[4]
+            order = json_data if json_data is not None else range(len(attrs) // 2)
+            json_data = [attrs[2 * idx + offset] for idx in order for offset in (0, 1)]
+
+        ret = {".type": self.types[type_idx]}
+        for idx in range(0, len(json_data), 2):
+            ret[self.names[json_data[idx]]] = self._objjson(json_data[idx + 1], memo.copy())
+        return ret
+
+    def _get_json_key(self, ref: int) -> Any:
+        node = self.nodes[ref]
+        if not isinstance(node, tuple):
+            return node
+        # The object itself is gone, use its text as the key
+        return str(self._objstr(ref, None, 0, self.printer._configs.overwrite(color=False)))
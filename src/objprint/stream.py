@@ -0,0 +1,184 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+import importlib
+import io
+import os
+from typing import Any, Callable, List, Tuple
+
+from .fragment import Fragment, Rendered
+
+
+# Returned instead of the rendered output when it's already written to the sink
+STREAMED = Fragment()
+
+StreamHook = Callable[[], bool]
+
+# The compressions by the suffix of the file name, each is a stdlib module
+# with an open() function
+COMPRESS_SUFFIXES = {
+    ".gz": "gzip",
+    ".xz": "lzma",
+    ".lzma": "lzma",
+    ".bz2": "bz2",
+}
+
+
+def stream_always() -> bool:
+    return True
+
+
+def open_file(file: Any, compress: str) -> Tuple[Any, bool]:
+    """
+    get the text file to print to. file could be a file object or a path,
+    a path is opened to append and the compression is picked by its suffix
+    if compress is "auto". A binary file object is wrapped if it should be
+    compressed
+
+    :return: (the text file, whether it should be closed after printing)
+    """
+    if isinstance(file, (str, os.PathLike)):
+        if compress == "auto":
+            compress = COMPRESS_SUFFIXES.get(os.path.splitext(file)[1], "none")
+        if compress == "none":
+            return open(file, "a", encoding="utf-8"), True
+    elif file is None or compress in ("auto", "none"):
+        return file, False
+
+    # A file object passed to open() is not closed with the returned one
+    return importlib.import_module(compress).open(file, "at", encoding="utf-8"), True
+
+
+class ChunkedWriter:
+    """
+    Collect the rendered pieces and write them to file in chunks of about
+    chunk_size characters, so the output never has to be held as a whole.
+
+    fsync can be "never", "chunk" to fsync after every chunk, or "close" to
+    fsync once after everything is written
+    """
+    def __init__(self, file: Any, chunk_size: int, fsync: str = "never") -> None:
+        self.file = file
+        self.chunk_size = chunk_size
+        self.fsync = fsync
+        self.buffer: List[str] = []
+        self.size = 0
+
+    def write(self, s: str) -> None:
+        self.buffer.append(s)
+        self.size += len(s)
+        if self.size >= self.chunk_size:
+            self.flush_chunk()
+
+    def writelines(self, lines: List[str]) -> None:
+        for s in lines:
+            self.write(s)
+
+    def write_rendered(self, rendered: Rendered) -> None:
+        if isinstance(rendered, str):
+            self.write(rendered)
+        elif rendered is not STREAMED:
+            rendered.write_to(self)
+
+    def flush_chunk(self) -> None:
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer = []
+            self.size = 0
+            if self.fsync == "chunk":
+                self._fsync()
+
+    def close(self) -> None:
+        self.flush_chunk()
+        if self.fsync != "never":
+            self._fsync()
+
+    def _fsync(self) -> None:
+        self.file.flush()
+        try:
+            os.fsync(self.file.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # Not backed by a real file, nothing to sync
+            pass
+
+
+class PackStream:
+    """
+    The state of a pack rendered in streaming mode.
+
+    The elements are kept until the pack is known to be multiline. Then the
+    header and the kept elements are written to the sink, and the following
+    elements are written as soon as they are rendered. A multiline child
+    calls child_hook() before it writes itself, so everything in front of it
+    is in the sink already
+    """
+    __slots__ = ("sink", "parent_hook", "header", "indent", "sep", "pending",
+                 "streaming", "multiline", "sep_needed")
+
+    def __init__(self, sink: ChunkedWriter, parent_hook: StreamHook, header: str, indent: str) -> None:
+        self.sink = sink
+        self.parent_hook = parent_hook
+        self.header = header
+        self.indent = indent
+        self.sep = ",\n" + indent
+        self.pending: List[Rendered] = []
+        self.streaming = False
+        self.multiline = False
+        self.sep_needed = False
+
+    def stream(self) -> bool:
+        if self.streaming:
+            return True
+        if not self.parent_hook():
+            return False
+        sink = self.sink
+        sink.write(f"{self.header}\n{self.indent}")
+        for idx, elem in enumerate(self.pending):
+            if idx > 0:
+                sink.write(self.sep)
+            sink.write_rendered(elem)
+        self.sep_needed = len(self.pending) > 0
+        self.pending = []
+        self.streaming = True
+        return True
+
+    def child_hook(self) -> bool:
+        self.multiline = True
+        if not self.stream():
+            return False
+        if self.sep_needed:
+            self.sink.write(self.sep)
+            self.sep_needed = False
+        return True
+
+    def add(self, elem: Rendered) -> None:
+        if not self.streaming:
+            self.pending.append(elem)
+            return
+        if elem is not STREAMED:
+            if self.sep_needed:
+                self.sink.write(self.sep)
+            self.sink.write_rendered(elem)
+        self.sep_needed = True
+
+
+class PrefixHook:
+    """
+    The stream hook of a value rendered after prefix, the prefix is written
+    right before the value starts streaming
+    """
+    __slots__ = ("sink", "parent_hook", "prefix", "written")
+
+    def __init__(self, sink: ChunkedWriter, parent_hook: StreamHook, prefix: Rendered) -> None:
+        self.sink = sink
+        self.parent_hook = parent_hook
+        self.prefix = prefix
+        self.written = False
+
+    def __call__(self) -> bool:
+        if not self.written:
+            if not self.parent_hook():
+                return False
+            self.sink.write_rendered(self.prefix)
+            self.written = True
+        return True
@@ -0,0 +1,124 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+import array
+import sys
+from typing import Any, List, Optional, Tuple
+
+
+# Number of values shown at the head and the tail of the summary
+SUMMARY_EDGE_ITEMS = 3
+
+# Type codes of array.array and formats of memoryview that are numbers
+_NUMERIC_CODES = set("bBhHiIlLqQfdnN")
+
+
+def _format_summary(
+        type_name: str,
+        size: str,
+        dtype: str,
+        stats: Optional[Tuple[Any, Any, Any]],
+        head: List[Any],
+        tail: List[Any]) -> str:
+    parts = [f"<{type_name} {size} dtype={dtype}"]
+    if stats is not None:
+        parts.append(f"min={stats[0]!r} max={stats[1]!r}")
+        if stats[2] is not None:
+            parts.append(f"mean={stats[2]!r}")
+    if tail:
+        values = ", ".join(repr(val) for val in head) + ", ..., " + ", ".join(repr(val) for val in tail)
+    else:
+        values = ", ".join(repr(val) for val in head)
+    parts.append(f"[{values}]>")
+    return " ".join(parts)
+
+
+def _head_tail(seq: Any, length: int) -> Tuple[List[Any], List[Any]]:
+    if length <= 2 * SUMMARY_EDGE_ITEMS:
+        return list(seq[:length]), []
+    return list(seq[:SUMMARY_EDGE_ITEMS]), list(seq[length - SUMMARY_EDGE_ITEMS:length])
+
+
+def _stats(seq: Any, length: int) -> Optional[Tuple[Any, Any, Any]]:
+    # min, max and sum iterate in C and never create strings
+    if length == 0:
+        return None
+    try:
+        mean = sum(seq) / length
+    except OverflowError:
+        # The mean of huge ints doesn't fit in a float
+        mean = None
+    return min(seq), max(seq), mean
+
+
+def ndarray_summary(arr: Any) -> str:
+    """
+    summary of a numpy array, the statistics are computed by numpy
+    """
+    flat = arr.flat
+    if arr.size <= 2 * SUMMARY_EDGE_ITEMS:
+        head, tail = flat[:].tolist(), []
+    else:
+        head, tail = flat[:SUMMARY_EDGE_ITEMS].tolist(), flat[arr.size - SUMMARY_EDGE_ITEMS:].tolist()
+    stats = None
+    if arr.size > 0 and arr.dtype.kind in "biuf":
+        stats = (arr.min().item(), arr.max().item(), arr.mean().item())
+    return _format_summary(type(arr).__name__, f"shape={arr.shape}", str(arr.dtype), stats, head, tail)
+
+
+def array_summary(arr: array.array) -> str:
+    length = len(arr)
+    head, tail = _head_tail(arr, length)
+    stats = _stats(arr, length) if arr.typecode in _NUMERIC_CODES else None
+    return _format_summary(type(arr).__name__, f"len={length}", arr.typecode, stats, head, tail)
+
+
+def memoryview_summary(mv: memoryview) -> Optional[str]:
+    """
+    summary of a memoryview, None if it's released
+    """
+    try:
+        ndim, fmt = mv.ndim, mv.format
+    except ValueError:
+        # Released memoryviews can't be read
+        return None
+    if ndim != 1 or fmt not in _NUMERIC_CODES:
+        return f"<{type(mv).__name__} shape={mv.shape} format={fmt} nbytes={mv.nbytes}>"
+    length = len(mv)
+    head, tail = _head_tail(mv, length)
+    return _format_summary(type(mv).__name__, f"len={length}", fmt, _stats(mv, length), head, tail)
+
+
+def list_summary(lst: list) -> Optional[str]:
+    """
+    summary of a list of ints or a list of floats, None for other lists
+    """
+    if not lst:
+        return None
+    elem_types = set(map(type, lst))
+    if len(elem_types) != 1:
+        return None
+    elem_type = elem_types.pop()
+    if elem_type is not int and elem_type is not float:
+        return None
+    length = len(lst)
+    head, tail = _head_tail(lst, length)
+    return _format_summary(type(lst).__name__, f"len={length}", elem_type.__name__, _stats(lst, length), head, tail)
+
+
+def summarize(obj: Any) -> Optional[str]:
+    """
+    return the summary of obj if it's a numeric container, otherwise None
+    """
+    if isinstance(obj, list):
+        return list_summary(obj)
+    elif isinstance(obj, array.array):
+        return array_summary(obj)
+    elif isinstance(obj, memoryview):
+        return memoryview_summary(obj)
+
+    # Do not import numpy if the user didn't
+    numpy = sys.modules.get("numpy")
+    if numpy is not None and isinstance(obj, numpy.ndarray):
+        return ndarray_summary(obj)
+    return None
@@ -2,8 +2,12 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
+import abc
+import collections.abc
+import gc
 import io
 import os
+import weakref
 from contextlib import redirect_stdout
 from objprint import op, objstr, config, install
 from .objtest import ObjprintTestCase
@@ -92,3 +96,89 @@ class TestBasic(ObjprintTestCase):
 
         self.assertRaises(TypeError, lambda: op.register_formatter(1, hex))
         self.assertRaises(TypeError, lambda: op.register_formatter(int, 1))
+
+    def test_formatter_abc(self):
+        class MyMapping(collections.abc.Mapping):
+            def __getitem__(self, key):
+                return 1
+
+            def __iter__(self):
+                return iter(["key"])
+
+            def __len__(self):
+                return 1
+
+        op.register_formatter(collections.abc.Mapping, lambda m: f"<mapping of {len(m)}>")
+        try:
+            # dict is a virtual subclass of Mapping
+            self.assertEqual(objstr([{1: 2}, MyMapping(), [1]]), "[<mapping of 1>, <mapping of 1>, [1]]")
+            op.register_formatter(dict, lambda d: "dict")
+            self.assertEqual(objstr([{1: 2}, MyMapping()]), "[dict, <mapping of 1>]")
+            op.unregister_formatter(dict)
+            self.assertEqual(objstr({1: 2}), "<mapping of 1>")
+            op.register_formatter(collections.abc.Mapping, lambda m: "mapping", inherit=False)
+            self.assertEqual(objstr({1: 2}), "{1: 2}")
+        finally:
+            op.unregister_formatter()
+        self.assertEqual(objstr({1: 2}), "{1: 2}")
+
+    def test_formatter_abc_register(self):
+        class Shape(abc.ABC):
+            pass
+
+        class Square:
+            pass
+
+        op.register_formatter(Shape, lambda s: "shape")
+        try:
+            self.assertNotEqual(objstr(Square()), "shape")
+            # The type becomes a virtual subclass after it's resolved
+            Shape.register(Square)
+            self.assertEqual(objstr(Square()), "shape")
+
+            # The resolved types are not kept alive
+            ref = weakref.ref(Square)
+            del Square
+            gc.collect()
+            self.assertIsNone(ref())
+        finally:
+            op.unregister_formatter()
+
+    def test_formatter_context(self):
+        class Bag:
+            def __init__(self, *items):
+                self.items = list(items)
+
+        @op.register_formatter(Bag, context=True)
+        def bag_formatter(bag, ctx):
+            self.assertEqual(ctx.width, 80)
+            self.assertGreater(ctx.depth, 0)
+            return ctx.pack(ctx.render(item) for item in bag.items)
+
+        try:
+            self.assertRegex(objstr(Bag(1, "a")), r"^<Bag 0x[0-9a-f]+\n  1,\n  'a'\n>$")
+
+            # The children are indented with the object and recursion is detected
+            bag = Bag(1)
+            bag.items.append(bag)
+            s = objstr({"key": bag})
+            self.assertRegex(s, r"^\{\n  'key': <Bag 0x[0-9a-f]+\n    1,\n    <Bag 0x[0-9a-f]+ \.\.\. >\n  >\n\}$")
+            self.assertRegex(objstr([[Bag(1)]], depth=2), r"^\[\[<Bag 0x[0-9a-f]+ \.\.\. >\]\]$")
+
+            # The object and its children take nodes from max_nodes
+            s = objstr(Bag(1, 2, [3], 4), max_nodes=3)
+            self.assertRegex(s, r"^<Bag 0x[0-9a-f]+\n  1,\n  2,\n  \[ \.\.\. \],\n  <int 0x[0-9a-f]+ \.\.\. >\n>$")
+            self.assertRegex(objstr([Bag(1)], max_nodes=1), r"^\[<Bag 0x[0-9a-f]+ \.\.\. >\]$")
+
+            nodes_left = []
+
+            @op.register_formatter(Bag, context=True)
+            def budget_formatter(bag, ctx):
+                nodes_left.append(ctx.nodes_left)
+                return ctx.pack(ctx.render(item) for item in bag.items)
+
+            objstr(Bag(1, 2), max_nodes=5)
+            objstr(Bag(1, 2))
+            self.assertEqual(nodes_left, [4, -1])
+        finally:
+            op.unregister_formatter()
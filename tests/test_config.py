@@ -16,6 +16,12 @@ class TestConfig(ObjprintTestCase):
     def test_config_wrong_type(self):
         self.assertRaises(TypeError, lambda: config(exclude=50))
 
+    def test_config_out_of_range(self):
+        for key, val in (("sample", -2), ("expand", -2), ("buffer_window", -1),
+                         ("workers", 0), ("render_cache", -1), ("chunk_size", 0)):
+            self.assertRaises(ValueError, lambda: config(**{key: val}))
+        config(sample=-1, workers=1, render_cache=0)
+
     def test_config_element(self):
         config(elements=2)
         e = ObjTest({"first": 1, "second": 2, "third": 3})
@@ -2,9 +2,11 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
+import gc
 from contextlib import redirect_stdout
 import json
 import io
+import weakref
 
 from objprint import add_objprint
 from objprint import op
@@ -106,3 +108,69 @@ class TestDecorator(ObjprintTestCase):
             output = buf.getvalue()
         expected = json.dumps({".type": "DecoratedIndentJsonCls", "name": "Lisa", "age": 19}, indent=2) + "\n"
         self.assertEqual(output, expected)
+
+    def test_class_renderer(self):
+        class Base:
+            shared = 3
+
+            def method(self):
+                pass
+
+            @property
+            def prop(self):
+                return self.value * 2
+
+        @add_objprint(print_methods=True, exclude=["hidden"])
+        class WithMethods(Base):
+            def __init__(self):
+                self.value = 1
+                self.hidden = 2
+                self.method = "shadowed"
+
+        class Sub(WithMethods):
+            pass
+
+        for obj in (WithMethods(), Sub()):
+            self.assertEqual(str(obj), op.objstr(obj, print_methods=True, exclude=["hidden"]))
+            obj.value = 5
+            obj.extra = [1, 2]
+            self.assertEqual(str(obj), op.objstr(obj, print_methods=True, exclude=["hidden"]))
+
+        # The changes of the classes after the first print are shown
+        obj = WithMethods()
+        str(obj)
+        Base.added = 4
+        WithMethods.method2 = lambda self: None
+        self.assertIn(".added = 4", str(obj))
+        self.assertIn("method2", str(obj))
+        self.assertEqual(str(obj), op.objstr(obj, print_methods=True, exclude=["hidden"]))
+
+        # An attribute replaced by another one keeps the number of keys
+        del Base.added
+        Base.swapped = 6
+        self.assertNotIn(".added", str(obj))
+        self.assertIn(".swapped = 6", str(obj))
+        self.assertEqual(str(obj), op.objstr(obj, print_methods=True, exclude=["hidden"]))
+
+    def test_class_collected(self):
+        @add_objprint
+        class Temp:
+            def __init__(self):
+                self.value = 1
+
+        self.assertIn(".value = 1", str(Temp()))
+        ref = weakref.ref(Temp)
+        del Temp
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_config_change(self):
+        obj = DecoratedClass()
+        self.assertEqual(str(obj), op.objstr(obj))
+        op.config(indent=4, exclude=["age"])
+        self.assertEqual(str(obj), op.objstr(obj))
+        self.assertNotIn("age", str(obj))
+        op.config(attr_source="instance")
+        self.assertEqual(str(obj), op.objstr(obj))
+        op.config(indent=2, exclude=[], attr_source="dir")
+        self.assertIn("age", str(obj))
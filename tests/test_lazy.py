@@ -0,0 +1,102 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+
+import io
+import logging
+
+from objprint import ObjPrintFormatter, lazy, objstr, view
+from .objtest import ObjTest, ObjprintTestCase
+
+
+class Counted:
+    count = 0
+
+    def __str__(self):
+        Counted.count += 1
+        return "counted"
+
+
+class TestLazy(ObjprintTestCase):
+    def setUp(self):
+        super().setUp()
+        self.buf = io.StringIO()
+        self.handler = logging.StreamHandler(self.buf)
+        self.logger = logging.getLogger("objprint_test")
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        Counted.count = 0
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        super().tearDown()
+
+    def test_lazy(self):
+        obj = ObjTest({"name": "Lisa", "lst": [1, 2]})
+        self.assertEqual(str(lazy(obj)), objstr(obj))
+        self.assertEqual(str(lazy(obj, indent=4, elements=1)), objstr(obj, indent=4, elements=1))
+        self.assertEqual(f"{lazy([1, 2])}", "[1, 2]")
+        self.assertEqual(f"{lazy([1, 2]):>8}", "  [1, 2]")
+        self.assertEqual(repr(lazy([1, 2])), "[1, 2]")
+
+    def test_lazy_logging(self):
+        obj = ObjTest({"c": Counted()})
+        self.logger.setLevel(logging.INFO)
+        self.logger.debug("%s", lazy(obj))
+        self.logger.debug(lazy(obj))
+        self.assertEqual(Counted.count, 0)
+        self.assertEqual(self.buf.getvalue(), "")
+
+        self.logger.info("obj: %s", lazy(obj))
+        self.assertEqual(self.buf.getvalue(), f"obj: {objstr(obj)}\n")
+
+    def test_formatter(self):
+        self.handler.setFormatter(ObjPrintFormatter("%(levelname)s %(message)s", objprint_config={"indent": 4}))
+        self.logger.setLevel(logging.INFO)
+        obj = ObjTest({"c": Counted(), "lst": [1, 2]})
+        self.logger.debug("%s", obj)
+        self.assertEqual(Counted.count, 0)
+
+        self.logger.info("%s %d %s", obj, 3, "x")
+        self.assertEqual(self.buf.getvalue(), f"INFO {objstr(obj, indent=4)} 3 x\n")
+
+        self.buf.seek(0)
+        self.buf.truncate()
+        self.logger.info("%(obj)s", {"obj": [obj]})
+        self.assertEqual(self.buf.getvalue(), f"INFO {objstr([obj], indent=4)}\n")
+
+    def test_view(self):
+        obj = ObjTest({"c": Counted(), "lst": [ObjTest({"i": i}) for i in range(300)]})
+        v = view(obj)
+        self.assertEqual(Counted.count, 0)
+
+        # Only the top level is expanded, and the elements are bounded
+        html = v._repr_html_()
+        self.assertEqual(html.count("<details open>"), 1)
+        self.assertEqual(html.count("<details>"), 101)
+        self.assertIn("&lt;ObjTest 0x", html)
+        self.assertIn("...", html)
+        self.assertEqual(
+            v._repr_html_(), objstr(obj, backend="html", color=True, elements=100, depth=8, max_nodes=1000, expand=1)
+        )
+
+        bundle = v._repr_mimebundle_()
+        self.assertEqual(set(bundle), {"text/html", "text/plain"})
+        # The plain text is bounded further
+        self.assertEqual(bundle["text/plain"], objstr(obj, elements=10, depth=3, max_nodes=50))
+        self.assertEqual(bundle["text/plain"], repr(v))
+        self.assertEqual(set(v._repr_mimebundle_(include=["text/plain"])), {"text/plain"})
+        self.assertEqual(set(v._repr_mimebundle_(exclude=["text/plain"])), {"text/html"})
+        self.assertEqual(repr(view([1, 2], elements=1)), "[1, ...]")
+
+        html = view(obj, expand=-1, elements=2)._repr_html_()
+        self.assertEqual(html.count("<details open>"), 4)
+        self.assertNotIn("<details>", html)
+
+        # The total number of nodes is bounded too
+        wide = [[ObjTest({"i": i}) for i in range(100)] for _ in range(100)]
+        html = view(wide)._repr_html_()
+        self.assertEqual(html.count(".i</span> = "), 989)
+        self.assertEqual(html.count("[ ... ]"), 90)
+        self.assertEqual(html, objstr(wide, backend="html", color=True, elements=100, depth=8, max_nodes=1000, expand=1))
+        self.assertLess(len(repr(view(wide))), 3000)
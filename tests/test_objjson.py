@@ -51,3 +51,21 @@ class TestObjJson(ObjprintTestCase):
         a = [1, 2]
         t = ObjTest({"lst1": a, "lst2": a})
         self.assertEqual(objjson(t), {".type": "ObjTest", "lst1": a, "lst2": a})
+
+    def test_objprint_protocol(self):
+        class Fields:
+            def __init__(self):
+                self.b = 1
+                self.a = [2]
+                self.cache = "big"
+
+            def __objprint__(self):
+                yield "b", self.b
+                yield "a", self.a
+
+        class Summary:
+            def __objprint__(self):
+                return "<summary>"
+
+        self.assertEqual(objjson(Fields()), {".type": "Fields", "b": 1, "a": [2]})
+        self.assertEqual(objjson([Summary()]), ["<summary>"])
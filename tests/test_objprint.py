@@ -2,16 +2,23 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
+import bz2
 import code
 from contextlib import redirect_stdout
+import gzip
 import io
 import json
+import lzma
+import os
 import re
 import sys
+import tempfile
+import threading
 from unittest.mock import patch
 
-from objprint import op
+from objprint import Theme, objstr, op
 from objprint.color_util import COLOR
+from objprint.objprint import _PrintConfig
 from .objtest import ObjTest, ObjprintTestCase
 
 
@@ -22,6 +29,83 @@ class TestObjprint(ObjprintTestCase):
             op(b, indent=5, depth=2, width=60)
             self.assertTrue(len(buf.getvalue()) > 0)
 
+    def test_print_fragments(self):
+        class Multi:
+            def __str__(self):
+                return "a\nb"
+
+        obj = ObjTest({"lst": [Multi(), {"key": Multi()}], "name": "x" * 100})
+        with io.StringIO() as buf:
+            op(obj, [obj], file=buf)
+            output = buf.getvalue()
+        self.assertEqual(output, op.objstr(obj) + "\n" + op.objstr([obj]) + "\n")
+
+    def test_print_streamed(self):
+        buf = io.StringIO()
+
+        class Probe:
+            def __str__(self):
+                return str(len(buf.getvalue()))
+
+        # The output in front of an object is written before it's rendered
+        op(ObjTest({"a": "x", "p": Probe()}), file=buf, chunk_size=1)
+        output = buf.getvalue()
+        self.assertEqual(output.split(".p = ")[1], f"{output.index(',')}\n>\n")
+
+        obj = ObjTest({"probes": [ObjTest({"lst": [1, 2]}), "s"], "short": [1, 2], "d": {"k": [ObjTest({})]}})
+        buf.seek(0)
+        buf.truncate()
+        op(obj, file=buf, chunk_size=1)
+        self.assertEqual(buf.getvalue(), op.objstr(obj) + "\n")
+
+        buf.seek(0)
+        buf.truncate()
+        op(obj, file=buf, chunk_size=1 << 20)
+        self.assertEqual(buf.getvalue(), op.objstr(obj) + "\n")
+
+        with tempfile.TemporaryFile("w+") as f:
+            for fsync in ("never", "chunk", "close"):
+                op(obj, file=f, chunk_size=16, fsync=fsync)
+            f.seek(0)
+            self.assertEqual(f.read(), (op.objstr(obj) + "\n") * 3)
+
+        with self.assertRaises(ValueError):
+            op(obj, file=buf, fsync="always")
+
+    def test_print_compressed(self):
+        obj = ObjTest({"lst": [ObjTest({"i": i}) for i in range(100)]})
+        expected = op.objstr(obj) + "\n"
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for suffix, module in ((".gz", gzip), (".xz", lzma), (".bz2", bz2)):
+                path = os.path.join(tmpdir, "dump.txt" + suffix)
+                op(obj, file=path, chunk_size=64)
+                op(obj, file=path)
+                with module.open(path, "rt") as f:
+                    self.assertEqual(f.read(), expected * 2)
+
+            path = os.path.join(tmpdir, "dump.txt")
+            op(obj, file=path)
+            with open(path) as f:
+                self.assertEqual(f.read(), expected)
+
+            path = os.path.join(tmpdir, "dump.gz")
+            op(obj, file=path, compress="none")
+            with open(path) as f:
+                self.assertEqual(f.read(), expected)
+
+            path = os.path.join(tmpdir, "dump.json.gz")
+            op(obj, file=path, format="json")
+            with gzip.open(path, "rt") as f:
+                self.assertEqual(json.loads(f.read()), op.objjson(obj))
+
+        with io.BytesIO() as buf:
+            op(obj, file=buf, compress="gzip")
+            self.assertFalse(buf.closed)
+            self.assertEqual(gzip.decompress(buf.getvalue()).decode(), expected)
+
+        with self.assertRaises(ValueError):
+            op(obj, file="dump.txt", compress="zip")
+
     def test_multiple(self):
         with io.StringIO() as buf, redirect_stdout(buf):
             op(1, 2)
@@ -288,6 +372,46 @@ class TestObjprint(ObjprintTestCase):
                 output = buf.getvalue()
             self.assertIn("Unknown", output.split("\n")[0])
 
+    def test_theme(self):
+        theme = Theme(attr="blue", header=208, string="#ff8700", number=COLOR.RED)
+        obj = ObjTest({"name": "Lisa", "age": 19, "ratio": 0.5, "alive": None})
+        with io.StringIO() as buf, redirect_stdout(buf):
+            op(obj, color=True, theme=theme)
+            output = buf.getvalue()
+        self.assertIn("\033[38;5;208m<ObjTest", output)
+        self.assertIn(f"{COLOR.BLUE}.name{COLOR.DEFAULT} = \033[38;2;255;135;0m'Lisa'{COLOR.DEFAULT}", output)
+        self.assertIn(f"= {COLOR.RED}19{COLOR.DEFAULT}", output)
+        self.assertIn(f"= {COLOR.RED}0.5{COLOR.DEFAULT}", output)
+        self.assertIn(f"{COLOR.BLUE}.alive{COLOR.DEFAULT} = None", output)
+        self.assertNotIn(COLOR.GREEN, output)
+        self.assertNotIn(COLOR.CYAN, output)
+
+        # The roles not given keep the default style, None turns it off
+        theme = Theme(attr=None)
+        self.assertEqual(theme.header, (COLOR.CYAN, COLOR.DEFAULT))
+        self.assertEqual(theme.attr_prefix("name"), ".name = ")
+        self.assertIs(theme.attr_prefix("name"), theme.attr_prefix("name"))
+        self.assertEqual(objstr([1, "a"], theme=Theme(number="red")), "[1, 'a']")
+
+        # The escape sequences take no width
+        lst = list(range(25))
+        colored = objstr(lst, color=True, theme=Theme(number=208))
+        self.assertNotIn("\n", colored)
+        self.assertEqual(len(re.sub("\033\\[[0-9;]*m", "", colored)), len(objstr(lst)))
+
+        with self.assertRaises(ValueError):
+            Theme(value="red")
+        with self.assertRaises(ValueError):
+            Theme(attr="pink")
+        with self.assertRaises(ValueError):
+            Theme(attr=256)
+        with self.assertRaises(ValueError):
+            Theme(attr="#12345")
+        with self.assertRaises(TypeError):
+            Theme(attr=1.5)
+        with self.assertRaises(TypeError):
+            op(obj, theme="blue")
+
     def test_no_color(self):
         with io.StringIO() as buf, redirect_stdout(buf):
             obj = ObjTest({"Age": 10, "grade": 5})
@@ -296,6 +420,44 @@ class TestObjprint(ObjprintTestCase):
         self.assertNotIn(COLOR.CYAN, output)
         self.assertNotIn(COLOR.DEFAULT, output)
 
+    def test_color_auto(self):
+        class Terminal(io.StringIO):
+            isatty_calls = 0
+
+            def isatty(self):
+                self.isatty_calls += 1
+                return True
+
+        obj = ObjTest({"Age": 10})
+        # color is on by default, but not set explicitly
+        default_global = dict(_PrintConfig._global, color=True, _color_set=False)
+        with patch.object(_PrintConfig, "_global", default_global):
+            with io.StringIO() as buf:
+                op(obj, file=buf)
+                self.assertNotIn(COLOR.CYAN, buf.getvalue())
+                op(obj, file=buf, color=True)
+                self.assertIn(COLOR.CYAN, buf.getvalue())
+
+            with Terminal() as buf:
+                op(obj, file=buf)
+                op(obj, file=buf)
+                self.assertEqual(buf.getvalue().count(COLOR.CYAN), 4)
+                # The stream is only checked once
+                self.assertEqual(buf.isatty_calls, 1)
+
+            with patch.dict(os.environ, {"NO_COLOR": "1"}), Terminal() as buf:
+                op(obj, file=buf)
+                self.assertNotIn(COLOR.CYAN, buf.getvalue())
+
+        # color set with config() is used even if the output is not a terminal
+        op.config(color=True)
+        try:
+            with io.StringIO() as buf:
+                op(obj, file=buf)
+                self.assertIn(COLOR.CYAN, buf.getvalue())
+        finally:
+            op.config(color=False)
+
     def test_unsortable_dict(self):
         d = {1: 2, "a": 3}
         with io.StringIO() as buf, redirect_stdout(buf):
@@ -396,3 +558,42 @@ class TestObjprint(ObjprintTestCase):
             output = buf.getvalue()
         self.assertNotIn(".a", output)
         self.assertIn(".b", output)
+
+    def test_thread_safety(self):
+        class Formatted:
+            pass
+
+        errors = []
+        stop = threading.Event()
+        obj = [ObjTest({"a": [1, 2, Formatted()], "b": {"c": 1.5}}) for _ in range(10)]
+        expected = op.objstr(obj)
+
+        def render():
+            try:
+                while not stop.is_set():
+                    s = op.objstr(obj)
+                    self.assertEqual(s.count(".b = {'c': 1.5}"), 10)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=render) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for _ in range(200):
+            op.register_formatter(Formatted, lambda x: "formatted")
+            op.unregister_formatter(Formatted)
+            op.config(indent=2)
+        stop.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(op.objstr(obj), expected)
+
+    def test_config_snapshot(self):
+        cfg = op._configs.overwrite()
+        op.config(indent=4)
+        try:
+            self.assertEqual(cfg.indent, 2)
+            self.assertEqual(op._configs.overwrite().indent, 4)
+        finally:
+            op.config(indent=2)
@@ -2,11 +2,25 @@
 # For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
 
 
+import array
+import dataclasses
+import functools
 import random
-from objprint import objstr, config
+import typing
+import unittest
+from unittest.mock import patch
+import objprint
+from objprint import Theme, objstr, config
+from objprint.objprint import _PrintConfig, _render_chunk
 from .objtest import ObjTest, ObjprintTestCase
 
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
 class TestObjStr(ObjprintTestCase):
     def test_list(self):
         lsts = (
@@ -178,3 +192,455 @@ class TestObjStr(ObjprintTestCase):
         t1 = b""
         s = objstr(t1, print_methods=True, honor_existing=False)
         self.assertIn("<signature unknown>", s)
+
+    def test_property_evaluated_once(self):
+        class T:
+            def __init__(self):
+                self.count = 0
+                self.x = 1
+
+            @property
+            def expensive(self):
+                self.count += 1
+                return self.count
+
+        t = T()
+        s = objstr(t, include=["x", "expensive"])
+        self.assertIn(".expensive = 1", s)
+        self.assertEqual(t.count, 1)
+
+    def test_print_properties(self):
+        class T:
+            __slots__ = ["slot"]
+
+            def __init__(self):
+                self.slot = "slot_val"
+
+            @property
+            def prop(self):
+                raise RuntimeError("should not be evaluated")
+
+        s = objstr(T(), print_properties=False)
+        self.assertIn("slot_val", s)
+        self.assertNotIn("prop", s)
+        with self.assertRaises(RuntimeError):
+            objstr(T())
+
+        class C:
+            def __init__(self):
+                self.count = 0
+
+            @functools.cached_property
+            def cached(self):
+                self.count += 1
+                return "computed"
+
+            def method(self):
+                pass
+
+        c = C()
+        s = objstr(c, print_properties=False, print_methods=True)
+        self.assertNotIn("cached", s)
+        self.assertIn("def method", s)
+        self.assertEqual(c.count, 0)
+        # Once it's computed, it's a regular field in the instance __dict__
+        c.cached
+        self.assertIn(".cached = 'computed'", objstr(c, print_properties=False))
+        self.assertEqual(c.count, 1)
+
+    def test_attr_source(self):
+        class Base:
+            cls_attr = "cls_val"
+
+            def method(self):
+                pass
+
+        class SlotBase(Base):
+            __slots__ = ["slot", "__private"]
+
+            def __init__(self):
+                self.slot = "slot_val"
+                self.__private = "private_val"
+
+        class T(SlotBase):
+            def __init__(self):
+                super().__init__()
+                self.inst = "inst_val"
+
+        t = T()
+        for attr_source in ("dir", "instance+class"):
+            s = objstr(t, attr_source=attr_source, attr_pattern=r"[^_].*|_SlotBase.*")
+            self.assertIn("inst_val", s)
+            self.assertIn("slot_val", s)
+            self.assertIn("private_val", s)
+            self.assertIn("cls_val", s)
+            self.assertNotIn("method", s)
+
+        s = objstr(t, attr_source="instance", attr_pattern=r"[^_].*|_SlotBase.*")
+        self.assertIn("inst_val", s)
+        self.assertIn("slot_val", s)
+        self.assertIn("private_val", s)
+        self.assertNotIn("cls_val", s)
+
+        s = objstr(t, attr_source="instance+class", print_methods=True)
+        self.assertIn("def method", s)
+
+        with self.assertRaises(ValueError):
+            objstr(t, attr_source="invalid")
+
+    def test_workers(self):
+        lst = [ObjTest({"idx": i, "lst": [i] * (i % 30)}) for i in range(100)]
+        self.assertEqual(objstr(lst, workers=4), objstr(lst))
+        self.assertEqual(objstr(lst, workers=4, elements=10), objstr(lst, elements=10))
+        self.assertEqual(objstr(lst, workers=4, depth=1), objstr(lst, depth=1))
+        self.assertEqual(objstr(list(range(10)), workers=4), objstr(list(range(10))))
+        d = {f"key{i}": lst[i] for i in range(20)}
+        self.assertEqual(objstr(d, workers=3), objstr(d))
+        self.assertEqual(objstr(set(range(100)), workers=2), objstr(set(range(100))))
+        self.assertEqual(objstr([lst[0]], workers=2), objstr([lst[0]]))
+        Pair = typing.NamedTuple("Pair", [("first", list), ("second", list)])
+        pair = Pair(lst[:50], lst[50:])
+        self.assertEqual(objstr(pair, workers=2), objstr(pair))
+
+        tuples = [(i % 3, (i % 5,)) for i in range(100)]
+        self.assertEqual(objstr(tuples, workers=4, render_cache=8), objstr(tuples))
+        # The chunks never share the render cache of the call
+        cfg = _PrintConfig(render_cache=8)
+        _render_chunk((objprint._objprint, tuples, None, cfg, False), 0, 50)
+        self.assertIsNone(cfg._render_cache)
+
+        # Never fork with other threads running
+        with patch("threading.active_count", return_value=2), \
+                patch("concurrent.futures.ProcessPoolExecutor.__init__", side_effect=AssertionError):
+            self.assertEqual(objstr(lst, workers=4), objstr(lst))
+
+    def test_diff(self):
+        pos = ObjTest({"x": 1, "y": 2})
+        t = ObjTest({"tick": 0, "pos": pos, "items": [1, 2], "d": {"a": 1}, "name": "sim"})
+        self.assertEqual(
+            objstr(t, diff=True).split("\n")[1:],
+            ["  .d['a'] = 1,", "  .items[0] = 1,", "  .items[1] = 2,", "  .name = 'sim',",
+             "  .pos.x = 1,", "  .pos.y = 2,", "  .tick = 0", ">"]
+        )
+        t.tick = 1
+        pos.x = 5
+        t.items.append(3)
+        t.d["b"] = [1]
+        del t.name
+        s = objstr(t, diff=True)
+        lines = s.split("\n")
+        self.assertEqual(
+            lines[1:],
+            ["  .d['b'][0] = 1,", "  .items[2] = 3,", "  .pos.x = 5,", "  .tick = 1,", "  del .name", ">"]
+        )
+        self.assertNotIn("\n", objstr(t, diff=True))
+
+        # Unchanged nodes with atomic children reuse the last rendering
+        t.items[0] = 10
+        s = objstr(t, diff=True)
+        self.assertIn(".items[0] = 10", s)
+        self.assertNotIn(".items[1]", s)
+
+        # Objects that can't be split are rendered as a whole
+        self.assertEqual(objstr([], diff=True), "[]")
+        self.assertEqual(objstr(1, diff=True), "1")
+
+        # A new value is rendered even if it takes the address of the old one
+        t.items[1] = float("1.5")
+        objstr(t, diff=True)
+        t.items[1] = 0
+        t.items[1] = float("2.5")
+        self.assertIn(".items[1] = 2.5", objstr(t, diff=True))
+
+        # The state is dropped when the object dies, and the number of states is capped
+        differ = objprint.objprint.differ
+        differ.clear()
+        objstr(ObjTest({"x": 1}), diff=True)
+        self.assertEqual(len(differ.states), 0)
+        lsts = [[i] for i in range(differ.max_states + 10)]
+        for lst in lsts:
+            objstr(lst, diff=True)
+        self.assertEqual(len(differ.states), differ.max_states)
+        self.assertNotIn(id(lsts[0]), differ.states)
+        self.assertIn(id(lsts[-1]), differ.states)
+        objprint.objprint.clear_diff()
+        self.assertEqual(len(differ.states), 0)
+
+        # The attributes are only read once on the first print
+        class Counter:
+            calls = 0
+
+            @property
+            def value(self):
+                Counter.calls += 1
+                return 1
+
+        counter = Counter()
+        self.assertIn(".value = 1", objstr(counter, diff=True))
+        self.assertEqual(Counter.calls, 1)
+
+    def test_sample(self):
+        self.assertEqual(objstr(list(range(100)), sample=4), "[0, 25, 50, 75, ... (100 in total)]")
+        self.assertEqual(objstr(tuple(range(3)), sample=4), "(0, 1, 2)")
+
+        s = set(range(1000))
+        output = objstr(s, sample=5, seed=1)
+        self.assertEqual(output, objstr(s, sample=5, seed=1))
+        self.assertTrue(output.endswith(", ... (1000 in total)}"))
+        self.assertEqual(output.count(","), 5)
+
+        d = {f"key{i:03}": i for i in range(200)}
+        output = objstr(d, sample=3)
+        keys = [item.split(":")[0] for item in output[1:].split(", ")[:3]]
+        self.assertEqual(keys, sorted(keys))
+        self.assertIn("(200 in total)", output)
+
+        with self.assertRaises(TypeError):
+            objstr(s, sample=5, seed="1")
+
+    def test_summary(self):
+        self.assertEqual(
+            objstr(list(range(100)), summary=True),
+            "<list len=100 dtype=int min=0 max=99 mean=49.5 [0, 1, 2, ..., 97, 98, 99]>"
+        )
+        self.assertEqual(objstr([0.5, 1.5], summary=True), "<list len=2 dtype=float min=0.5 max=1.5 mean=1.0 [0.5, 1.5]>")
+        self.assertEqual(objstr([1, 2.5], summary=True), "[1, 2.5]")
+        self.assertEqual(
+            objstr([10 ** 400, 1], summary=True),
+            f"<list len=2 dtype=int min=1 max={10 ** 400} [{10 ** 400}, 1]>"
+        )
+        self.assertEqual(objstr([], summary=True), "[]")
+        self.assertEqual(objstr(list(range(3))), "[0, 1, 2]")
+
+        arr = array.array("d", [1, 2, 3])
+        self.assertEqual(objstr(arr, summary=True), "<array len=3 dtype=d min=1.0 max=3.0 mean=2.0 [1.0, 2.0, 3.0]>")
+        self.assertEqual(objstr(array.array("u", "ab"), summary=True), "<array len=2 dtype=u ['a', 'b']>")
+
+        mv = memoryview(array.array("i", range(10)))
+        self.assertEqual(objstr(mv, summary=True), "<memoryview len=10 dtype=i min=0 max=9 mean=4.5 [0, 1, 2, ..., 7, 8, 9]>")
+        self.assertEqual(objstr(mv.cast("B").cast("i", (2, 5)), summary=True), "<memoryview shape=(2, 5) format=i nbytes=40>")
+        mv.release()
+        self.assertEqual(objstr([mv], summary=True), objstr([mv]))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_summary_numpy(self):  # pragma: no cover
+        arr = numpy.arange(12, dtype=numpy.int64).reshape(3, 4)
+        self.assertEqual(
+            objstr(arr, summary=True),
+            "<ndarray shape=(3, 4) dtype=int64 min=0 max=11 mean=5.5 [0, 1, 2, ..., 9, 10, 11]>"
+        )
+
+    def test_buffer(self):
+        self.assertEqual(objstr(b"abc"), "b'abc'")
+        self.assertEqual(objstr(bytearray(b"hello world"), buffer_window=4), "<bytearray len=11 68 65 6c 6c |hell| ...>")
+        self.assertEqual(objstr(memoryview(b"a\n")), "<memoryview len=2 61 0a |a.|>")
+        self.assertEqual(objstr(memoryview(array.array("h", [1, 2]))), "<memoryview len=4 01 00 02 00 |....|>")
+        self.assertEqual(objstr([b"x" * 100], buffer_window=2), "[<bytes len=100 78 78 |xx| ...>]")
+        mv = memoryview(b"abc")
+        mv.release()
+        self.assertIn("released", objstr(mv))
+
+    def test_honor_existing_multiline(self):
+        class T:
+            def __str__(self):
+                return "a\nb\n\nc"
+
+        self.assertEqual(objstr(T()), "a\nb\n\nc")
+        self.assertEqual(objstr([T()]), "[\n  a\n  b\n  \n  c\n]")
+        self.assertEqual(objstr({"k": [T()]}), "{\n  'k': [\n    a\n    b\n    \n    c\n  ]\n}")
+        obj = ObjTest({"t": T()})
+        self.assertRegex(objstr([obj]), r"\[\n  <ObjTest 0x[0-9a-f]*\n    \.t = a\n    b\n    \n    c\n  >\n\]")
+
+    def test_width_boundary(self):
+        # The elements are 12 characters in total, separators are not counted
+        lst = ["abc", "de", "f"]
+        self.assertEqual(objstr(lst, width=12), "['abc', 'de', 'f']")
+        self.assertEqual(objstr(lst, width=11), "[\n  'abc',\n  'de',\n  'f'\n]")
+        self.assertEqual(objstr(["a" * 1000, "\n"], width=10), f"[\n  '{'a' * 1000}',\n  '\n'\n]")
+        self.assertEqual(objstr(["\n", "a"], width=10), "[\n  '\n',\n  'a'\n]")
+        self.assertEqual(objstr([[1, 2], "\n"], elements=1, width=20), "[[1, ...], ...]")
+
+    def test_max_nodes(self):
+        lst = [[1, [2]], [3], {"k": [4]}]
+        self.assertEqual(objstr(lst, max_nodes=3), "[[1, [2]], [ ... ], { ... }]")
+        self.assertEqual(objstr(lst, max_nodes=0), "[ ... ]")
+        self.assertEqual(objstr(lst, max_nodes=-1), objstr(lst))
+        self.assertEqual(objstr(lst, max_nodes=3, workers=2), objstr(lst, max_nodes=3))
+        self.assertEqual(objstr(lst, max_nodes=3), objstr(lst, max_nodes=3))
+
+    def test_render_cache(self):
+        class Counter:
+            count = 0
+
+            @property
+            def value(self):
+                Counter.count += 1
+                return Counter.count
+
+        t = (Counter(), "a")
+        lst = [t, [t], t, t]
+        s = objstr(lst, render_cache=16)
+        # t is rendered once for each indent level
+        self.assertEqual(Counter.count, 2)
+        self.assertEqual(s.count(".value = 1"), 3)
+        self.assertEqual(s.count(".value = 2"), 1)
+
+        Counter.count = 0
+        objstr(lst)
+        self.assertEqual(Counter.count, 4)
+
+        # Mutable values are never cached
+        Counter.count = 0
+        objstr([[Counter()]] * 3, render_cache=16)
+        self.assertEqual(Counter.count, 3)
+
+        # So are frozen dataclasses with mutable fields
+        @dataclasses.dataclass(frozen=True)
+        class Frozen:
+            items: list
+
+        Counter.count = 0
+        objstr([Frozen([Counter()])] * 3, render_cache=16)
+        self.assertEqual(Counter.count, 3)
+
+        # A shared value is not reused where an object in it is an ancestor
+        x, y, n = ObjTest({}), ObjTest({}), ObjTest({})
+        x.t = y.t = (n,)
+        n.ref = x
+        self.assertEqual(objstr([x, y], depth=6, render_cache=16), objstr([x, y], depth=6))
+        self.assertEqual(objstr([y, x], depth=6, render_cache=16), objstr([y, x], depth=6))
+
+        # The least recently used value is evicted
+        Counter.count = 0
+        t2 = (Counter(),)
+        objstr([t, t2, t, t2], render_cache=1)
+        self.assertEqual(Counter.count, 4)
+        Counter.count = 0
+        objstr([t, t2, t, t2], render_cache=2)
+        self.assertEqual(Counter.count, 2)
+
+    def test_record(self):
+        @dataclasses.dataclass
+        class Point:
+            x: int
+            y: int
+            hidden: int = dataclasses.field(default=0, repr=False)
+
+            @property
+            def norm(self):
+                return self.x + self.y
+
+            def move(self, dx):
+                self.x += dx
+
+        @dataclasses.dataclass
+        class WithRepr:
+            x: int
+
+            def __repr__(self):
+                return "WithRepr"
+
+        @dataclasses.dataclass(frozen=True)
+        class Missing:
+            x: int
+            y: int = dataclasses.field(init=False)
+
+        class Pair(typing.NamedTuple):
+            first: int
+            second: str
+
+        s = objstr(Point(1, 2))
+        self.assertRegex(s, r"^<Point 0x[0-9a-f]+\n  \.x = 1,\n  \.y = 2\n>$")
+        self.assertEqual(objstr(WithRepr(1)), "WithRepr")
+        self.assertRegex(objstr(WithRepr(1), honor_existing=False), r"^<WithRepr 0x[0-9a-f]+\n  \.x = 1\n>$")
+        self.assertRegex(objstr(Missing(1)), r"^<Missing 0x[0-9a-f]+\n  \.x = 1\n>$")
+        self.assertRegex(objstr(Pair(1, "a")), r"^<Pair 0x[0-9a-f]+\n  \.first = 1,\n  \.second = 'a'\n>$")
+        self.assertRegex(objstr(Pair(1, "a"), exclude=["first"]), r"^<Pair 0x[0-9a-f]+\n  \.second = 'a'\n>$")
+
+        # The generated renderer gives the same result as the generic path
+        p = Point(1, [Pair(2, "b")])
+        for cfg in ({}, {"color": True}, {"label": ["x"], "color": True}, {"include": ["y"]}, {"depth": 2}):
+            s = objstr(p, **cfg)
+            with patch.object(objprint.objprint, "_get_record_renderer", return_value=None):
+                self.assertEqual(s, objstr(p, **cfg))
+            self.assertNotIn("hidden", s)
+            self.assertNotIn("norm", s)
+
+        # The methods, properties and other attributes are printed with the methods
+        p = Point(1, 2)
+        p.extra = 3
+        s = objstr(p, print_methods=True, honor_existing=False)
+        for line in ("def move(dx)", ".extra = 3", ".hidden = 0", ".norm = 3", ".x = 1"):
+            self.assertIn(line, s)
+        self.assertIn("def count", objstr(Pair(1, "a"), print_methods=True))
+
+        # Methods stored in fields are not attributes
+        self.assertNotIn(".x", objstr(Point(p.__repr__, 1)))
+
+    def test_objprint_protocol(self):
+        class Fields:
+            def __init__(self):
+                self.b = 1
+                self.a = [2]
+                self._private = 3
+                self.cache = "big"
+
+            def __repr__(self):
+                return "Fields"
+
+            def __objprint__(self):
+                yield "b", self.b
+                yield "a", self.a
+                yield "_private", self._private
+
+        class Summary:
+            def __init__(self, s):
+                self.s = s
+
+            def __objprint__(self):
+                return self.s
+
+        # __objprint__ is used over __repr__, in its own order
+        self.assertRegex(objstr(Fields()), r"^<Fields 0x[0-9a-f]+\n  \.b = 1,\n  \.a = \[2\]\n>$")
+        self.assertRegex(objstr(Fields(), exclude=["a"]), r"^<Fields 0x[0-9a-f]+\n  \.b = 1\n>$")
+        self.assertEqual(objstr([Summary("<summary>")]), "[<summary>]")
+        self.assertEqual(objstr(ObjTest({"x": Summary("a\nb")})).split("\n")[1:], ["  .x = a", "  b", ">"])
+
+    def test_html(self):
+        class Tag:
+            def __repr__(self):
+                return "<tag>\n</tag>"
+
+        obj = ObjTest({"name": "<b>&", "lst": [1, {"k<": "v"}], "tag": Tag(), "empty": ObjTest({})})
+        s = objstr(obj, backend="html")
+        self.assertTrue(s.startswith('<div class="objprint"'))
+        self.assertTrue(s.endswith("</details>&gt;</div>"))
+        self.assertIn("&lt;ObjTest 0x", s)
+        self.assertIn(".name = '&lt;b&gt;&amp;'", s)
+        self.assertIn(".lst = [1, {'k&lt;': 'v'}]", s)
+        self.assertIn(".tag = &lt;tag&gt;\n  &lt;/tag&gt;", s)
+        self.assertNotIn("<span", s)
+        self.assertNotIn("\033", s)
+        # Only the multiline packs are collapsible
+        self.assertEqual(s.count("<details"), 1)
+        self.assertEqual(s.count("<summary"), s.count("</summary>"))
+        self.assertRegex(s, r"\.empty = &lt;ObjTest 0x[0-9a-f]+&gt;")
+
+        s = objstr(obj, backend="html", color=True, label=["name"])
+        self.assertIn('<span style="color: #00cd00">.lst</span> = ', s)
+        self.assertIn('<span style="color: #cdcd00">.name = ', s)
+        self.assertIn('<span style="color: #00cdcd">&lt;ObjTest 0x', s)
+        self.assertNotIn("\033", s)
+
+        theme = Theme(number=208, string="#123abc")
+        self.assertEqual(
+            objstr([1, "a"], backend="html", color=True, theme=theme).split("</style>")[1],
+            '[<span style="color: #ff8700">1</span>, <span style="color: #123abc">\'a\'</span>]</div>'
+        )
+
+        # The markup and the escaped characters are counted by their displayed width
+        lst = ["<&>" * 5] * 4
+        self.assertNotIn("\n", objstr(lst, backend="html", color=True, theme=theme).split("</style>")[1])
+
+        with self.assertRaises(ValueError):
+            objstr(obj, backend="rich")
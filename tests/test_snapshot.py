@@ -0,0 +1,116 @@
+# Licensed under the Apache License: http://www.apache.org/licenses/LICENSE-2.0
+# For details: https://github.com/gaogaotiantian/objprint/blob/master/NOTICE.txt
+
+
+import dataclasses
+import io
+import os
+import tempfile
+import typing
+
+from objprint import objjson, objstr, render_snapshot, snapshot
+from .objtest import ObjTest, ObjprintTestCase
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Pair(typing.NamedTuple):
+    first: typing.Any
+    second: typing.Any
+
+
+class Repr:
+    def __repr__(self):
+        return "Repr<\nlines>"
+
+
+class TestSnapshot(ObjprintTestCase):
+    def test_render(self):
+        leaf = ObjTest({"name": "leaf", "lst": [1, 2.5, None, True]})
+        obj = ObjTest({
+            "leaf": leaf,
+            "shared": [leaf, leaf],
+            "d": {"b": Point(1, 2), "a": Pair("x", Repr()), 3: (1,)},
+            "s": {1},
+            "func": len,
+            "data": b"\x00" * 40,
+            "_private": 1,
+        })
+        obj.self = obj
+        data = snapshot(obj)
+        self.assertIsInstance(data, bytes)
+        for cfg in ({}, {"indent": 4, "width": 20}, {"depth": 2}, {"elements": 1}, {"label": ["name"]},
+                    {"color": True}, {"backend": "html"}, {"skip_recursion": False, "depth": 4}, {"max_nodes": 3}):
+            self.assertEqual(render_snapshot(data, **cfg), objstr(obj, **cfg))
+
+        # The attributes are selected when the snapshot is taken
+        data = snapshot(obj, include=["leaf", "name"], print_methods=True)
+        self.assertEqual(render_snapshot(data), objstr(obj, include=["leaf", "name"], print_methods=True))
+        self.assertEqual(render_snapshot(snapshot(obj, attr_pattern=".*")), objstr(obj, attr_pattern=".*"))
+
+        # It doesn't change with the object
+        data = snapshot(leaf)
+        expected = objstr(leaf)
+        leaf.name = "changed"
+        self.assertEqual(render_snapshot(data), expected)
+
+    def test_sample(self):
+        obj = ObjTest({
+            "lst": list(range(1000)),
+            "s": set(range(100)),
+            "d": {f"key{i:03}": [i] for i in range(200)},
+            "t": (1, 2),
+        })
+        data = snapshot(obj)
+        for cfg in ({"sample": 3}, {"sample": 0}, {"sample": 5, "seed": 7}, {"sample": 150}):
+            self.assertEqual(render_snapshot(data, **cfg), objstr(obj, **cfg))
+
+        # The values are not in the snapshot
+        for key in ("summary", "diff"):
+            with self.assertRaises(ValueError):
+                render_snapshot(data, **{key: True})
+
+    def test_json(self):
+        obj = ObjTest({"lst": [1, "a", {"k": Point(1, 2)}], "pair": Pair(1, [2])})
+        data = snapshot(obj)
+        self.assertEqual(render_snapshot(data, format="json"), objjson(obj))
+        self.assertEqual(render_snapshot(snapshot([obj, obj]), format="json"), objjson([obj, obj]))
+
+        obj.lst.append(obj)
+        with self.assertRaises(ValueError):
+            render_snapshot(snapshot(obj), format="json")
+        with self.assertRaises(ValueError):
+            render_snapshot(data, format="xml")
+
+    def test_file(self):
+        obj = ObjTest({"lst": [ObjTest({"i": i}) for i in range(10)]})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "obj.snapshot")
+            snapshot(obj, file=path)
+            self.assertEqual(render_snapshot(path), objstr(obj))
+
+        with io.BytesIO() as f:
+            snapshot(obj, file=f)
+            f.seek(0)
+            self.assertEqual(render_snapshot(f), objstr(obj))
+
+        with self.assertRaises(ValueError):
+            render_snapshot(b"not a snapshot")
+        with self.assertRaises(ValueError):
+            render_snapshot(snapshot(obj)[:20])
+        with self.assertRaises(ValueError):
+            render_snapshot(snapshot(obj)[:7])
+        data = snapshot(obj)
+        with self.assertRaisesRegex(ValueError, "version"):
+            render_snapshot(data[:6] + b"\xff" + data[7:])
+
+    def test_scalars(self):
+        obj = [10 ** 30, -(10 ** 30), 2 ** 63, -1, True, False, None, 1.5, float("inf"), "\u4e2d\ud800", "", []]
+        data = snapshot(obj)
+        self.assertEqual(render_snapshot(data), objstr(obj))
+        self.assertEqual(render_snapshot(data, format="json"), objjson(obj))
+        self.assertIsNone(render_snapshot(snapshot(None), format="json"))